@@ -22,7 +22,7 @@ from sklearn.metrics import roc_auc_score, precision_recall_curve, auc
 parser = argparse.ArgumentParser()
 parser.add_argument("--dataset",
                     help="dataset name",
-                    type=str, choices=["mnist", "cifar10", "gtsrb", "bdd100k", "dreyeve", "prosivic"])
+                    type=str, choices=["mnist", "cifar10", "gtsrb", "bdd100k", "dreyeve", "prosivic", "tabular"])
 parser.add_argument("--solver",
                     help="solver", type=str,
                     choices=["sgd", "momentum", "nesterov", "adagrad", "rmsprop", "adadelta", "adam", "adamax"])
@@ -77,6 +77,10 @@ parser.add_argument("--R_update_lp_obj",
 parser.add_argument("--warm_up_n_epochs",
                     help="specify the first epoch the QP solver should be applied",
                     type=int, default=10)
+parser.add_argument("--coreset_size",
+                    help="train Deep SVDD on this many samples chosen by k-center selection on the pretrained "
+                         "features (0 uses all train samples)",
+                    type=int, default=Cfg.coreset_size)
 parser.add_argument("--use_batch_norm",
                     help="specify if Batch Normalization should be applied in the network",
                     type=int, default=0)
@@ -176,9 +180,24 @@ parser.add_argument("--ad_experiment",
 parser.add_argument("--weight_dict_init",
                     help="initialize first layer filters by dictionary",
                     type=int, default=0)
+parser.add_argument("--dict_learn_n_patches",
+                    help="budget of random patches the dictionary is learned on (default 0 uses all patches)",
+                    type=int, default=Cfg.dict_learn_n_patches)
+parser.add_argument("--dict_learn_n_iter",
+                    help="number of mini-batch iterations of dictionary learning",
+                    type=int, default=Cfg.dict_learn_n_iter)
+parser.add_argument("--cache_dictionary",
+                    help="specify if learned dictionaries should be cached and reused for the same train data",
+                    type=int, default=Cfg.cache_dictionary)
 parser.add_argument("--pca",
                     help="apply pca in preprocessing",
                     type=int, default=0)
+parser.add_argument("--pca_solver",
+                    help="PCA solver: exact 'full', or chunked 'incremental'/'randomized' for large data",
+                    type=str, choices=["full", "incremental", "randomized"], default=Cfg.pca_solver)
+parser.add_argument("--cache_pca",
+                    help="specify if fitted PCA components should be cached and reused for the same train data",
+                    type=int, default=Cfg.cache_pca)
 parser.add_argument("--unit_norm_used",
                     help="norm to use for scaling the data to unit norm",
                     type=str, default="l2")
@@ -188,6 +207,48 @@ parser.add_argument("--gcn",
 parser.add_argument("--zca_whitening",
                     help="specify if data should be whitened",
                     type=int, default=0)
+parser.add_argument("--zca_rank",
+                    help="rank of memory-bounded randomized ZCA whitening (0 uses exact dense ZCA)",
+                    type=int, default=Cfg.zca_rank)
+parser.add_argument("--data_cache",
+                    help="specify if preprocessed data should be cached and reused in later runs",
+                    type=int, default=Cfg.use_data_cache)
+parser.add_argument("--shared_data",
+                    help="specify if concurrent runs should share one copy of the preprocessed data in shared memory",
+                    type=int, default=Cfg.shared_data)
+parser.add_argument("--data_storage",
+                    help="dtype in which images are held in memory (uint8 and float16 are normalized per batch)",
+                    type=str, choices=["float32", "uint8", "float16"], default=Cfg.data_storage)
+parser.add_argument("--packed_data",
+                    help="specify if images should be read from packed shards (python -m datasets.shards <folder>)",
+                    type=int, default=Cfg.use_packed_data)
+parser.add_argument("--video_data",
+                    help="specify if frames should be read from the video ranges of the splits in config.py",
+                    type=int, default=Cfg.use_video_data)
+parser.add_argument("--video_stride",
+                    help="use every video_stride-th frame of the video ranges",
+                    type=int, default=Cfg.video_stride)
+parser.add_argument("--image_pyramid",
+                    help="specify if images should be read from cached 256/128/64 image pyramids of the image folders",
+                    type=int, default=Cfg.use_image_pyramid)
+parser.add_argument("--image_size",
+                    help="height and width of the images (a pyramid level with --image_pyramid), 0 keeps the default",
+                    type=int, default=0)
+parser.add_argument("--dedup_train_data",
+                    help="specify if near-duplicate train images (e.g. consecutive video frames) should be dropped",
+                    type=int, default=Cfg.dedup_train_data)
+parser.add_argument("--dedup_max_distance",
+                    help="max. Hamming distance of the 64 bit average hashes of near-duplicate train images",
+                    type=int, default=Cfg.dedup_max_distance)
+parser.add_argument("--stream_data",
+                    help="specify if batches should be read from disk instead of loading the data into memory",
+                    type=int, default=Cfg.stream_data)
+parser.add_argument("--prefetch_depth",
+                    help="number of batches prepared ahead on a background thread (0 disables prefetching)",
+                    type=int, default=Cfg.prefetch_depth)
+parser.add_argument("--shuffle_samples",
+                    help="specify if samples (not only the batch order) should be shuffled in each training epoch",
+                    type=int, default=Cfg.shuffle_samples)
 parser.add_argument("--mnist_val_frac",
                     help="specify the fraction the validation set of the initial training data should be",
                     type=float, default=1./6)
@@ -224,6 +285,33 @@ parser.add_argument("--cifar10_outlier",
 parser.add_argument("--gtsrb_rep_dim",
                     help="specify the dimensionality of the last layer",
                     type=int, default=32)
+parser.add_argument("--tabular_train",
+                    help="CSV or NPY sources of the (normal) train samples of the tabular dataset",
+                    type=str, nargs="*", default=Cfg.tabular_train)
+parser.add_argument("--tabular_val",
+                    help="CSV or NPY sources of the (normal) validation samples of the tabular dataset",
+                    type=str, nargs="*", default=Cfg.tabular_val)
+parser.add_argument("--tabular_test_in",
+                    help="CSV or NPY sources of the normal test samples of the tabular dataset",
+                    type=str, nargs="*", default=Cfg.tabular_test_in)
+parser.add_argument("--tabular_test_out",
+                    help="CSV or NPY sources of the anomalous test samples of the tabular dataset",
+                    type=str, nargs="*", default=Cfg.tabular_test_out)
+parser.add_argument("--tabular_csv_header",
+                    help="specify if the first line of the CSV sources holds the column names",
+                    type=int, default=Cfg.tabular_csv_header)
+parser.add_argument("--tabular_delimiter",
+                    help="column delimiter of the CSV sources",
+                    type=str, default=Cfg.tabular_delimiter)
+parser.add_argument("--tabular_standardize",
+                    help="specify if the features are scaled to zero mean and unit variance of the train data",
+                    type=int, default=Cfg.tabular_standardize)
+parser.add_argument("--tabular_architecture",
+                    help="units of the dense layers (e.g. 128_64_32), the last one is the representation dimension",
+                    type=str, default=Cfg.tabular_architecture)
+parser.add_argument("--tabular_bias",
+                    help="specify if bias terms are used in the tabular network",
+                    type=int, default=Cfg.tabular_bias)
 parser.add_argument("--bdd100k_bias",
                     help="specify if bias terms are used in bdd100k network",
                     type=int, default=1)
@@ -296,10 +384,31 @@ def main():
     Cfg.out_frac = args.out_frac
     Cfg.ad_experiment = bool(args.ad_experiment)
     Cfg.weight_dict_init = bool(args.weight_dict_init)
+    Cfg.dict_learn_n_patches = args.dict_learn_n_patches
+    Cfg.dict_learn_n_iter = args.dict_learn_n_iter
+    Cfg.cache_dictionary = bool(args.cache_dictionary)
     Cfg.pca = bool(args.pca)
+    Cfg.pca_solver = args.pca_solver
+    Cfg.cache_pca = bool(args.cache_pca)
     Cfg.unit_norm_used = args.unit_norm_used
     Cfg.gcn = bool(args.gcn)
     Cfg.zca_whitening = bool(args.zca_whitening)
+    Cfg.zca_rank = args.zca_rank
+    Cfg.use_data_cache = bool(args.data_cache)
+    Cfg.shared_data = bool(args.shared_data)
+    Cfg.data_storage = args.data_storage
+    Cfg.use_packed_data = bool(args.packed_data)
+    Cfg.use_video_data = bool(args.video_data)
+    Cfg.video_stride = args.video_stride
+    Cfg.use_image_pyramid = bool(args.image_pyramid)
+    if args.image_size > 0:
+        Cfg.image_height = Cfg.image_width = args.image_size
+        Cfg.bdd100k_image_height = Cfg.bdd100k_image_width = args.image_size
+    Cfg.dedup_train_data = bool(args.dedup_train_data)
+    Cfg.dedup_max_distance = args.dedup_max_distance
+    Cfg.stream_data = bool(args.stream_data)
+    Cfg.prefetch_depth = args.prefetch_depth
+    Cfg.shuffle_samples = bool(args.shuffle_samples)
     Cfg.mnist_val_frac = args.mnist_val_frac
     Cfg.mnist_bias = bool(args.mnist_bias)
     Cfg.mnist_rep_dim = args.mnist_rep_dim
@@ -312,6 +421,15 @@ def main():
     Cfg.cifar10_normal = args.cifar10_normal
     Cfg.cifar10_outlier = args.cifar10_outlier
     Cfg.gtsrb_rep_dim = args.gtsrb_rep_dim
+    Cfg.tabular_train = args.tabular_train
+    Cfg.tabular_val = args.tabular_val
+    Cfg.tabular_test_in = args.tabular_test_in
+    Cfg.tabular_test_out = args.tabular_test_out
+    Cfg.tabular_csv_header = bool(args.tabular_csv_header)
+    Cfg.tabular_delimiter = args.tabular_delimiter
+    Cfg.tabular_standardize = bool(args.tabular_standardize)
+    Cfg.tabular_architecture = args.tabular_architecture
+    Cfg.tabular_bias = bool(args.tabular_bias)
 
     # neural network
     Cfg.softmax_loss = (args.loss == 'ce')
@@ -336,6 +454,7 @@ def main():
     Cfg.R_update_scalar_method = args.R_update_scalar_method
     Cfg.R_update_lp_obj = args.R_update_lp_obj
     Cfg.warm_up_n_epochs = args.warm_up_n_epochs
+    Cfg.coreset_size = args.coreset_size
     Cfg.batch_size = args.batch_size
     Cfg.leaky_relu = bool(args.leaky_relu)
 
@@ -45,6 +45,12 @@ parser.add_argument("--zca_whitening",
 parser.add_argument("--pca",
                     help="apply pca in preprocessing",
                     type=int, default=0)
+parser.add_argument("--pca_solver",
+                    help="PCA solver: exact 'full', or chunked 'incremental'/'randomized' for large data",
+                    type=str, choices=["full", "incremental", "randomized"], default=Cfg.pca_solver)
+parser.add_argument("--cache_pca",
+                    help="specify if fitted PCA components should be cached and reused for the same train data",
+                    type=int, default=Cfg.cache_pca)
 parser.add_argument("--mnist_val_frac",
                     help="specify the fraction the validation set of the initial training data should be",
                     type=float, default=0)  # default of 0 as k-fold cross-validation is performed internally.
@@ -89,6 +95,8 @@ def main():
     Cfg.gcn = bool(args.gcn)
     Cfg.zca_whitening = bool(args.zca_whitening)
     Cfg.pca = bool(args.pca)
+    Cfg.pca_solver = args.pca_solver
+    Cfg.cache_pca = bool(args.cache_pca)
     Cfg.mnist_val_frac = args.mnist_val_frac
     Cfg.mnist_normal = args.mnist_normal
     Cfg.mnist_outlier = args.mnist_outlier
@@ -0,0 +1,253 @@
+"""
+Benchmarks of the data pipeline.
+
+usage: python benchmark.py preprocessing [--n_train 20000] [--shape 3 64 64] [--gcn 1] [--repeats 3]
+       python benchmark.py zca [--dataset mnist] [--ranks 64 256] [--n 10000]
+       python benchmark.py coreset --coreset_sizes 1000 2000 --baseline_args "--dataset mnist --loss svdd ..."
+"""
+import os
+import sys
+import glob
+import gzip
+import time
+import shlex
+import shutil
+import subprocess
+import resource
+import argparse
+import numpy as np
+import cPickle as pickle
+import multiprocessing as mp
+
+from datasets.preprocessing import normalize_data, global_contrast_normalization, rescale_to_unit_interval, \
+    fused_normalization, ZCAWhitening, RandomizedZCAWhitening
+
+
+def synthetic_images(n, shape, seed=0):
+
+    rng = np.random.RandomState(seed)
+    return rng.randint(0, 256, size=(n,) + tuple(shape)).astype(np.float32)
+
+
+def time_best(fn, make_input, repeats):
+    """
+    best wall clock time of fn over repeats runs on fresh inputs, and the last result
+    """
+
+    best = np.inf
+    for _ in range(repeats):
+        data = make_input()
+        start_time = time.time()
+        fn(*data)
+        best = min(best, time.time() - start_time)
+
+    return best, data
+
+
+def benchmark_preprocessing(args):
+
+    splits = (args.n_train, args.n_val, args.n_test)
+    X = [synthetic_images(n, args.shape, seed=i) for i, n in enumerate(splits)]
+    n_bytes = sum(X_split.nbytes for X_split in X)
+
+    def make_input():
+        return [X_split.copy() for X_split in X]
+
+    def separate(X_train, X_val, X_test):
+        normalize_data(X_train, X_val, X_test, scale=np.float32(255))
+        if args.gcn:
+            global_contrast_normalization(X_train, X_val, X_test, scale=args.gcn_scale)
+        rescale_to_unit_interval(X_train, X_val, X_test)
+
+    def fused(X_train, X_val, X_test):
+        fused_normalization(X_train, X_val, X_test, scale=np.float32(255), apply_gcn=args.gcn,
+                            gcn_scale=args.gcn_scale, n_jobs=args.n_jobs)
+
+    print("Preprocessing %d/%d/%d images of shape %s (%.1f MB), gcn=%r"
+          % (splits + (args.shape, n_bytes / 2. ** 20, bool(args.gcn))))
+
+    t_separate, X_separate = time_best(separate, make_input, args.repeats)
+    t_fused, X_fused = time_best(fused, make_input, args.repeats)
+
+    max_diff = max(np.max(np.abs(a - b)) if a.size else 0. for a, b in zip(X_separate, X_fused))
+    identical = all(np.array_equal(a, b) for a, b in zip(X_separate, X_fused))
+
+    print("{:32} {:.3f}s ({:.1f} MB/s)".format("Separate passes:", t_separate, n_bytes / 2. ** 20 / t_separate))
+    print("{:32} {:.3f}s ({:.1f} MB/s)".format("Fused:", t_fused, n_bytes / 2. ** 20 / t_fused))
+    print("{:32} {:.2f}x".format("Speedup:", t_separate / t_fused))
+    print("{:32} {} (max abs. difference {:.2e})".format("Bit-for-bit identical:", identical, max_diff))
+
+
+def load_images(dataset, n=None):
+    """
+    train images of MNIST or CIFAR-10 from ../data scaled to [0,1], or random
+    images of the same shape if the dataset is not available
+    """
+
+    if dataset == "mnist":
+        filename = "../data/train-images-idx3-ubyte.gz"
+        if os.path.exists(filename):
+            with gzip.open(filename, 'rb') as f:
+                X = np.frombuffer(f.read(), np.uint8, offset=16).reshape(-1, 1, 28, 28)
+        else:
+            print("MNIST not found in ../data, using random images")
+            X = synthetic_images(60000, (1, 28, 28))
+
+    if dataset == "cifar10":
+        filenames = ["../data/cifar-10-batches-py/data_batch_%i" % i for i in range(1, 6)]
+        if all(os.path.exists(filename) for filename in filenames):
+            X = []
+            for filename in filenames:
+                with open(filename, 'rb') as f:
+                    X.append(pickle.load(f)['data'])
+            X = np.concatenate(X).reshape(-1, 3, 32, 32)
+        else:
+            print("CIFAR-10 not found in ../data, using random images")
+            X = synthetic_images(50000, (3, 32, 32))
+
+    if n is not None:
+        X = X[:n]
+
+    return X.astype(np.float32) / np.float32(255)
+
+
+def _proc_status_mb(field):
+
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024.
+
+
+def reset_peak_rss():
+    """
+    reset the peak resident memory of this process to its current value
+    (Linux only), so temporaries of loading do not count towards the peak
+    """
+
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def peak_rss_mb():
+
+    if os.path.exists("/proc/self/status"):
+        return _proc_status_mb("VmHWM")
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def _run_zca(queue, args, rank):
+
+    X = load_images(args.dataset, args.n)
+    if os.path.exists("/proc/self/clear_refs"):
+        reset_peak_rss()
+    rss_data = peak_rss_mb()
+
+    start_time = time.time()
+    if rank > 0:
+        X_white = RandomizedZCAWhitening(rank=rank).fit_transform(X)
+    else:
+        X_white = ZCAWhitening().fit_transform(X)
+    elapsed = time.time() - start_time
+
+    queue.put((elapsed, peak_rss_mb() - rss_data, np.asarray(X_white[:args.n_compare], dtype=np.float64)))
+
+
+def benchmark_zca(args):
+    """
+    time and peak memory (on top of the loaded data) of dense ZCA whitening
+    and the randomized version for several ranks. every run is a separate
+    process, so peak memory of one run does not affect the others.
+    """
+
+    results = []
+    for rank in [0] + args.ranks:
+        queue = mp.Queue()
+        process = mp.Process(target=_run_zca, args=(queue, args, rank))
+        process.start()
+        results.append((rank,) + queue.get())
+        process.join()
+
+    X_dense = results[0][3]
+    print("ZCA whitening of %s train images (n=%s)" % (args.dataset, args.n if args.n else "all"))
+    print("{:16} {:>10} {:>14} {:>16}".format("Method", "Time", "Peak memory", "Rel. difference"))
+    for rank, elapsed, memory, X_white in results:
+        name = "dense" if rank == 0 else "rank %d" % rank
+        difference = np.linalg.norm(X_white - X_dense) / np.linalg.norm(X_dense)
+        print("{:16} {:>9.2f}s {:>11.1f} MB {:>16.2e}".format(name, elapsed, memory, difference))
+
+
+def benchmark_coreset(args):
+    """
+    test AUC and train time of Deep SVDD trained on the full train data and on
+    coresets of several sizes. every run is a baseline.py experiment in its own
+    directory below xp_root. the autoencoder is pretrained once in the full run
+    and its weights are reused by the coreset runs, so all runs select from and
+    start with the same encoder. requires only_test = False in config.py.
+    """
+
+    results = []
+    ae_weights = None
+    for size in [0] + args.coreset_sizes:
+        xp_dir = os.path.join(args.xp_root, "coreset_%d" % size)
+        if not os.path.exists(xp_dir):
+            os.makedirs(xp_dir)
+        if ae_weights is not None and not os.path.exists(os.path.join(xp_dir, "ae_pretrained_weights.p")):
+            shutil.copy(ae_weights, xp_dir)
+
+        command = [sys.executable, "baseline.py"] + shlex.split(args.baseline_args) + \
+                  ["--xp_dir", xp_dir, "--coreset_size", str(size)]
+        print("Running %s" % " ".join(command))
+        subprocess.check_call(command)
+
+        if os.path.exists(os.path.join(xp_dir, "ae_pretrained_weights.p")):
+            ae_weights = os.path.join(xp_dir, "ae_pretrained_weights.p")
+
+        with open(sorted(glob.glob(os.path.join(xp_dir, "AD_results*.p")))[-1], 'rb') as f:
+            ad_log = pickle.load(f)
+        results.append((size, ad_log))
+
+    print("Deep SVDD on coresets of the train data (%s)" % args.baseline_args)
+    print("{:16} {:>10} {:>10} {:>12} {:>12}".format("Train data", "Samples", "Test AUC", "Train time", "Time/epoch"))
+    for size, ad_log in results:
+        name = "full" if size == 0 else "coreset %d" % size
+        print("{:16} {:>10d} {:>9.2f}% {:>11.1f}s {:>11.2f}s".format(
+            name, ad_log['n_train'], 100. * ad_log['test_auc'], ad_log['train_time'],
+            ad_log['train_time'] / max(ad_log['n_epochs'], 1)))
+
+
+benchmarks = {
+    'preprocessing': benchmark_preprocessing,
+    'zca': benchmark_zca,
+    'coreset': benchmark_coreset,
+}
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=sorted(benchmarks))
+    parser.add_argument("--n_train", type=int, default=20000)
+    parser.add_argument("--n_val", type=int, default=2000)
+    parser.add_argument("--n_test", type=int, default=5000)
+    parser.add_argument("--shape", type=int, nargs=3, default=[3, 64, 64])
+    parser.add_argument("--gcn", type=int, default=1)
+    parser.add_argument("--gcn_scale", choices=["std", "l1", "l2"], default="l2")
+    parser.add_argument("--n_jobs", type=int, default=0, help="threads of the fused pipeline (0 uses all cores)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--dataset", choices=["mnist", "cifar10"], default="mnist")
+    parser.add_argument("--n", type=int, default=None, help="number of train images to whiten (default all)")
+    parser.add_argument("--ranks", type=int, nargs="+", default=[64, 256])
+    parser.add_argument("--n_compare", type=int, default=1000,
+                        help="number of whitened images compared against dense ZCA")
+
+    parser.add_argument("--coreset_sizes", type=int, nargs="+", default=[1000, 2000])
+    parser.add_argument("--xp_root", default="../log/coreset_benchmark")
+    parser.add_argument("--baseline_args", default="--dataset mnist --solver adam --loss svdd --lr 0.0001 "
+                                                   "--n_epochs 50 --pretrain 1",
+                        help="arguments of baseline.py shared by all runs")
+
+    args = parser.parse_args()
+    benchmarks[args.benchmark](args)
@@ -5,7 +5,7 @@ from datasets import loadbdd100k
 
 
 class Configuration(object):
-    only_test = bool(1)
+    only_test = bool(1)  # SMILE datasets then load only the test data if the preprocessing of training was saved
     export_results = bool(1)
     dataset = "dreyeve"
 
@@ -102,6 +102,7 @@ class Configuration(object):
         n_val = bdd100k_n_val
         n_test = bdd100k_n_test
         n_test_in = int(n_test*(1-bdd100k_out_frac))
+
     # Final Layer
     softmax_loss = False
     svdd_loss = False
@@ -128,6 +129,9 @@ class Configuration(object):
 
     # Pre-training and autoencoder configuration
     weight_dict_init = False
+    dict_learn_n_patches = 0  # opt-in budget of random patches the dictionary is learned on (0 uses all patches)
+    dict_learn_n_iter = 1000  # number of mini-batch iterations of dictionary learning
+    cache_dictionary = False  # store learned dictionaries in data_cache_dir and reuse them for the same train data
     pretrain = False
     ae_loss = "l2"
     ae_lr_drop = True  # separate into "region search" and "fine-tuning" stages
@@ -155,6 +159,33 @@ class Configuration(object):
     center_fixed = True  # determine if center c should be fixed or not (in which case c is an optimization parameter)
     QP_solver = 'cvxopt'  # the library to use for solving the QP (or LP). One of ("cvxopt" or "gurobi")
     warm_up_n_epochs = 0  # iterations until R and c are also getting optimized
+    coreset_size = 0  # train on this many samples chosen by k-center selection on the pretrained features (0 uses all)
+
+    # Data loading
+    n_decode_workers = 0  # number of processes decoding image files (0 uses all cores)
+    n_preprocessing_threads = 0  # number of threads normalizing the data (0 uses all cores)
+    use_data_cache = False  # store preprocessed data memory-mapped and reuse it in later runs
+    data_cache_dir = "../data/cache/"
+    shared_data = False  # concurrent runs on this node share one read-only copy of the preprocessed data in shared_data_dir
+    shared_data_dir = "/dev/shm/deep_svdd_data/"  # on tmpfs, entries stay in memory until removed (rm -r) or reboot
+    stream_data = False  # read batches from disk instead of holding the data in memory (no ZCA/PCA)
+    stream_buffer_size = 1024  # number of samples decoded into the shuffle buffer when streaming
+    prefetch_depth = 2  # number of batches prepared ahead on a background thread (0 disables prefetching)
+    shuffle_samples = False  # opt-in: shuffle samples in each training epoch, by default only the order of the batches
+    data_storage = "float32"  # "float32", or compact "uint8"/"float16" storage normalized per batch (no ZCA/PCA)
+    use_packed_data = False  # read images from the packed shards next to the image folders (see datasets/shards.py)
+    use_image_pyramid = False  # read images from cached pyramids of the image folders, decoded once (no decoding later)
+    pyramid_base_shape = (256, 256, 3)  # (height, width, channels) of the base level of the image pyramids
+    pyramid_n_levels = 3  # levels of half the size of the previous one, e.g. 256/128/64
+    use_video_data = False  # read the frames of the video ranges below directly from the video files (see datasets/video.py)
+    video_stride = 10  # use every video_stride-th frame of the video ranges
+    # video files or (video file, first frame, stop frame or None for the end) ranges of each split
+    video_train = []
+    video_val = []
+    video_test_in = []
+    video_test_out = []
+    dedup_train_data = False  # drop near-duplicate train images (e.g. consecutive video frames) when loading them into memory
+    dedup_max_distance = 4  # max. Hamming distance of the 64 bit average hashes of near-duplicate images
 
     # Data preprocessing
     if dataset in ("bdd100k", "prosivic", "dreyeve"):
@@ -164,9 +195,13 @@ class Configuration(object):
         out_frac = floatX(.1)
     ad_experiment = True
     pca = False
+    pca_solver = "full"  # "full" (exact sklearn PCA), or chunked "incremental"/"randomized" for large data
+    pca_max_components = 512  # maximum number of components of the chunked PCA solvers
+    cache_pca = False  # store fitted PCA components in data_cache_dir and reuse them for the same train data
     unit_norm_used = "l2"  # "l2" or "l1"
     gcn = False
     zca_whitening = False
+    zca_rank = 0  # rank of memory-bounded randomized ZCA whitening (0 uses exact dense ZCA)
 
     # MNIST parameters
     mnist_val_frac = 1./6
@@ -187,6 +222,17 @@ class Configuration(object):
     # GTSRB parameters
     gtsrb_rep_dim = 32
 
+    # Tabular parameters (CSV or NPY sources of feature vectors, one row per sample)
+    tabular_train = []  # sources of the (normal) train samples
+    tabular_val = []  # sources of the (normal) validation samples
+    tabular_test_in = []  # sources of the normal test samples
+    tabular_test_out = []  # sources of the anomalous test samples
+    tabular_csv_header = False  # first line of the CSV sources holds the column names
+    tabular_delimiter = ","
+    tabular_standardize = True  # scale the features to zero mean and unit variance of the train data
+    tabular_architecture = "128_64_32"  # units of the dense layers, the last one is the representation dimension
+    tabular_bias = False
+
     # Plot parameters
     xp_path = "../log/" + dataset + "/"
     title_suffix = ""
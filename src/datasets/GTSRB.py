@@ -4,6 +4,7 @@ from datasets.preprocessing import center_data, normalize_data, rescale_to_unit_
 from utils.visualization.mosaic_plot import plot_mosaic
 from utils.misc import flush_last_line
 from config import Configuration as Cfg
+from datasets.decoding import parallel_fill
 
 import matplotlib
 matplotlib.use('Agg')  # or 'PS', 'PDF', 'SVG'
@@ -92,23 +93,9 @@ class GTSRB_DataLoader(DataLoader):
         # normalize data (if original scale should not be preserved)
         if not original_scale:
 
-            # simple rescaling to [0,1]
-            normalize_data(self._X_train, self._X_val, self._X_test, scale=np.float32(255))
-
-            # global contrast normalization
-            if Cfg.gcn:
-                global_contrast_normalization(self._X_train, self._X_val, self._X_test, scale=Cfg.unit_norm_used)
-
-            # ZCA whitening
-            if Cfg.zca_whitening:
-                self._X_train, self._X_val, self._X_test = zca_whitening(self._X_train, self._X_val, self._X_test)
-
-            # rescale to [0,1] (w.r.t. min and max in train data)
-            rescale_to_unit_interval(self._X_train, self._X_val, self._X_test)
-
-            # PCA
-            if Cfg.pca:
-                self._X_train, self._X_val, self._X_test = pca(self._X_train, self._X_val, self._X_test, 0.95)
+            # rescaling to [0,1], global contrast normalization, ZCA whitening, rescaling to [0,1]
+            # (w.r.t. min and max in train data) and PCA, with statistics fitted on the train data
+            self.preprocess()
 
         flush_last_line()
         print("Data loaded.")
@@ -229,14 +216,13 @@ class GTSRB_DataLoader(DataLoader):
         nnet.addSigmoidLayer()
 
 
-def readTrafficSigns(rootpath, which_set="train", label=14):
+def readTrafficSigns(rootpath, which_set="train", label=14, n_jobs=None):
     '''
     Reads traffic sign data for German Traffic Sign Recognition Benchmark.
+    Only the images of the requested label are decoded, cropped and resized,
+    in parallel (n_jobs worker processes, default Cfg.n_decode_workers).
     '''
 
-    images = [] # images
-    labels = [] # corresponding labels
-
     if which_set == "train":
         dir_path = rootpath + "Final_Training/Images"
         prefix = dir_path + '/' + format(label, '05d') + '/'  # subdirectory for class
@@ -248,30 +234,27 @@ def readTrafficSigns(rootpath, which_set="train", label=14):
 
     gtReader = csv.reader(gtFile, delimiter=';') # csv parser for annotations file
     gtReader.next() # skip header
-    # loop over all images in current annotations file
-    for row in gtReader:
-        x1 = int(row[3])
-        y1 = int(row[4])
-        x2 = int(row[5])
-        y2 = int(row[6])
-        img = plt.imread(prefix + row[0])  # the 1th column is the filename
-        img = img[x1:x2, y1:y2, :]  # remove border of 10% around sign
-        img = cv2.resize(img, (32, 32))  # resize to 32x32
-        img = np.rollaxis(img, 2)  # img.shape = (3, 32, 32)
-        images.append(img)
-        labels.append(int(row[7]))  # the 8th column is the label
+    # keep the images of the requested label, the 8th column is the label
+    signs = [(prefix + row[0], int(row[3]), int(row[4]), int(row[5]), int(row[6]))
+             for row in gtReader if int(row[7]) == label]
     gtFile.close()
 
-    # convert to numpy arrays
-    idx = (np.array(labels) == label)
-    n = np.sum(idx)
-    X = np.zeros((n, 3, 32, 32), np.float32)
-    i = 0
-    for img in range(len(images)):
-        if idx[img]:
-            X[i, :] = images[img]
-            i += 1
-        else:
-            pass
+    if n_jobs is None:
+        n_jobs = Cfg.n_decode_workers
+
+    X, _ = parallel_fill(signs, (3, 32, 32), load_traffic_sign, dtype=np.float32, n_jobs=n_jobs)
 
     return X
+
+
+def load_traffic_sign(sign):
+    '''
+    decode, crop and resize one traffic sign (filename, x1, y1, x2, y2) to a (3, 32, 32) array
+    '''
+
+    filename, x1, y1, x2, y2 = sign
+    img = plt.imread(filename)
+    img = img[x1:x2, y1:y2, :]  # remove border of 10% around sign
+    img = cv2.resize(img, (32, 32))  # resize to 32x32
+
+    return np.rollaxis(img, 2)  # img.shape = (3, 32, 32)
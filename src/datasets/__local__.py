@@ -1 +1 @@
-implemented_datasets = ('mnist', 'cifar10', 'gtsrb','bdd100k', 'dreyeve', 'prosivic')
+implemented_datasets = ('mnist', 'cifar10', 'gtsrb','bdd100k', 'dreyeve', 'prosivic', 'tabular')
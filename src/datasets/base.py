@@ -1,7 +1,18 @@
-from iterator import indices_generator
+import os
+import numpy as np
+
+from iterator import iterate_batches
+from cache import cached_arrays, load_cached, save_cached, lock_entry
+from compact import CompactArray
+from prefetch import prefetch, WaitStats
+from preprocessing import Preprocessor
 from config import Configuration as Cfg
 
 
+# key -> (X, y) of deferred splits loaded in this process, shared between data loaders
+_loaded_splits = {}
+
+
 class DataLoader(object):
 
     def __init__(self, seed=0):
@@ -21,6 +32,50 @@ class DataLoader(object):
 
         self.on_memory = None
 
+        # time the training and evaluation loops wait on batches
+        self.wait_stats = WaitStats()
+
+        # which_set -> (load, key) of splits loaded on first access
+        self._deferred_splits = {}
+
+    def __getattr__(self, name):
+
+        # only called for attributes which are not set, i.e. also for splits which are not loaded yet
+        deferred = self.__dict__.get('_deferred_splits')
+        if deferred and name[:3] in ("_X_", "_y_") and name[3:] in deferred:
+            self.load_split(name[3:])
+            return getattr(self, name)
+
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    def defer_split(self, which_set, load, key=None):
+        """
+        load the split which_set ("train", "val" or "test") only when its data or
+        labels are first accessed. load() has to set _X_<which_set> and
+        _y_<which_set>. splits with the same (hashable) key are loaded once per
+        process and shared, e.g. between the autoencoder and the network of a
+        test-only run.
+        """
+
+        self.__dict__.pop("_X_" + which_set, None)
+        self.__dict__.pop("_y_" + which_set, None)
+        self._deferred_splits[which_set] = (load, key)
+
+    def load_split(self, which_set):
+
+        load, key = self._deferred_splits.pop(which_set)
+
+        if key is not None and key in _loaded_splits:
+            X, y = _loaded_splits[key]
+            setattr(self, "_X_" + which_set, X)
+            setattr(self, "_y_" + which_set, y)
+            return
+
+        load()
+
+        if key is not None:
+            _loaded_splits[key] = (getattr(self, "_X_" + which_set), getattr(self, "_y_" + which_set))
+
     def check_base(self):
 
         for key in (self.__dict__):
@@ -28,14 +83,13 @@ class DataLoader(object):
                 "%s attribute should not be None" % key
 
         if self.on_memory:
-            assert self.n_train == len(self._X_train)
-            assert self.n_train == len(self._y_train)
-
-            assert self.n_val == len(self._X_val)
-            assert self.n_val == len(self._y_val)
-
-            assert self.n_test == len(self._X_test)
-            assert self.n_test == len(self._y_test)
+            # deferred splits are checked without loading them
+            for which_set in ("train", "val", "test"):
+                if which_set in self._deferred_splits:
+                    continue
+                n = getattr(self, "n_" + which_set)
+                assert n == len(getattr(self, "_X_" + which_set))
+                assert n == len(getattr(self, "_y_" + which_set))
 
     def check_specific(self):
 
@@ -54,38 +108,215 @@ class DataLoader(object):
 
         raise NotImplementedError("Should be replaced on each dataset")
 
-    def get_epoch_train(self):
+    def preprocessing_params(self):
+        """
+        parameters which (besides the input files) determine the preprocessed
+        data of a loader. used to key the dataset cache.
+        """
+
+        return dict(dataset=self.dataset_name, seed=self.seed, batch_size=Cfg.batch_size,
+                    ad_experiment=Cfg.ad_experiment, gcn=Cfg.gcn, unit_norm_used=Cfg.unit_norm_used,
+                    zca_whitening=Cfg.zca_whitening, zca_rank=Cfg.zca_rank, pca=Cfg.pca, pca_solver=Cfg.pca_solver,
+                    pca_max_components=Cfg.pca_max_components, data_storage=Cfg.data_storage,
+                    dedup_max_distance=Cfg.dedup_max_distance if Cfg.dedup_train_data else None)
+
+    def preprocess(self):
+        """
+        fit the preprocessing specified in Cfg on the train data and transform
+        all splits with the fitted statistics
+        """
+
+        self.preprocessor = Preprocessor(scale=np.float32(255), gcn=Cfg.gcn, gcn_scale=Cfg.unit_norm_used,
+                                         zca=Cfg.zca_whitening, zca_rank=Cfg.zca_rank, pca=Cfg.pca,
+                                         pca_solver=Cfg.pca_solver, pca_max_components=Cfg.pca_max_components,
+                                         pca_cache_dir=Cfg.data_cache_dir if Cfg.cache_pca else None,
+                                         n_jobs=Cfg.n_preprocessing_threads)
+
+        self._X_train = self.preprocessor.fit_transform(self._X_train)
+        self._X_val = self.preprocessor.transform(self._X_val)
+        self._X_test = self.preprocessor.transform(self._X_test)
+
+    def save_preprocessor(self, filename):
+        """
+        save the fitted preprocessing statistics (if the data was preprocessed by preprocess())
+        """
+
+        if hasattr(self, 'preprocessor'):
+            self.preprocessor.save(filename)
+
+    def load_preprocessor(self, filename):
+        """
+        load preprocessing statistics fitted in an earlier run.
+        returns False if there are none.
+        """
+
+        if not os.path.exists(filename):
+            return False
+
+        self.preprocessor = Preprocessor.load(filename)
+
+        return True
+
+    def permute_files(self, train_files, val_files):
+        """
+        shuffle the train and val file lists to obtain random validation splits
+        and subset the train files such that we only get batches of the same
+        size. permuting the files instead of decoded arrays lets the loaders
+        decode every image directly into its final position.
+        """
+
+        np.random.seed(self.seed)
+
+        perm_train = np.random.permutation(len(train_files))
+        perm_val = np.random.permutation(len(val_files))
+        train_files = [train_files[i] for i in perm_train]
+        val_files = [val_files[i] for i in perm_val]
+
+        assert(len(train_files) >= Cfg.batch_size)
+        n_train = (len(train_files) / Cfg.batch_size) * Cfg.batch_size
+        subset = np.random.choice(len(train_files), n_train, replace=False)
+        train_files = [train_files[i] for i in subset]
+
+        return train_files, val_files
+
+    def select_train(self, idx):
+        """
+        keep only the train samples idx (e.g. a coreset)
+        """
+
+        assert self.on_memory, "selecting train samples requires in-memory data"
+
+        if isinstance(self._X_train, CompactArray):
+            self._X_train = CompactArray(self._X_train.data[idx], self._X_train.scale[idx], self._X_train.offset[idx])
+        else:
+            self._X_train = self._X_train[idx]
+        self._y_train = self._y_train[idx]
+
+        self.n_train = len(idx)
+        Cfg.n_batches = int(np.ceil(self.n_train * 1. / Cfg.batch_size))
+
+    def data_cache_dir(self):
+
+        # preprocessed data shared by concurrent runs is held in shared memory
+        return Cfg.shared_data_dir if Cfg.shared_data else Cfg.data_cache_dir
+
+    def load_cached_data(self, key):
+        """
+        open the preprocessed splits stored under key memory-mapped.
+        returns False if the cache holds no such entry.
+
+        with Cfg.shared_data, a missing entry is locked until save_cached_data()
+        stored it, so concurrent runs of the same data wait for this run and
+        then attach to its copy instead of decoding the data themselves.
+        """
+
+        cached = load_cached(self.data_cache_dir(), key)
+        if cached is None and Cfg.shared_data:
+            self._cache_lock = lock_entry(self.data_cache_dir(), key)
+            cached = load_cached(self.data_cache_dir(), key)
+            if cached is not None:
+                # prepared by another run while waiting
+                self.release_cache_lock()
+        if cached is None:
+            return False
+
+        for name in cached_arrays:
+            if name + "_scale" in cached:
+                setattr(self, name, CompactArray(cached[name], cached[name + "_scale"], cached[name + "_offset"]))
+            else:
+                setattr(self, name, cached[name])
+
+        self.n_train = len(self._y_train)
+        self.n_val = len(self._y_val)
+        self.n_test = len(self._y_test)
+        self.out_frac = cached['meta'].get('out_frac', Cfg.out_frac)
+        if 'preprocessor' in cached['meta']:
+            self.preprocessor = cached['meta']['preprocessor']
+
+        Cfg.n_batches = int(np.ceil(self.n_train * 1. / Cfg.batch_size))
+
+        print("Data loaded from cache.")
+
+        return True
+
+    def save_cached_data(self, key):
+        """
+        store the preprocessed splits under key in the dataset cache.
+        """
+
+        arrays = dict()
+        for name in cached_arrays:
+            X = getattr(self, name)
+            if isinstance(X, CompactArray):
+                arrays[name] = X.data
+                arrays[name + "_scale"] = X.scale
+                arrays[name + "_offset"] = X.offset
+            else:
+                arrays[name] = X
+
+        meta = {'out_frac': self.out_frac}
+        if hasattr(self, 'preprocessor'):
+            meta['preprocessor'] = self.preprocessor
+
+        save_cached(self.data_cache_dir(), key, arrays, meta=meta)
+
+        if Cfg.shared_data:
+            # attach to the shared copy as well (dropping the private one) and let waiting runs in
+            del arrays
+            self.load_cached_data(key)
+            self.release_cache_lock()
+
+    def release_cache_lock(self):
+        """
+        release the lock of a cache entry taken by load_cached_data when the entry is stored
+        """
+
+        if '_cache_lock' in self.__dict__:
+            self._cache_lock.close()
+            del self._cache_lock
 
-        assert self.on_memory, "only for data loaded on memory"
+    def get_epoch_train(self):
 
-        for (batch, idx) in indices_generator(shuffle=True,
-                                              batch_size=Cfg.batch_size,
-                                              n=self.n_train):
-            yield self._X_train[batch], self._y_train[batch], idx
+        # samples are only shuffled (not just the batch order) if Cfg.shuffle_samples is set
+        return self.get_batches('train', shuffle=True, shuffle_samples=Cfg.shuffle_samples)
 
     def get_epoch_val(self):
 
-        for (batch, idx) in indices_generator(shuffle=False,
-                                              batch_size=Cfg.batch_size,
-                                              n=self.n_val):
-            yield self._X_val[batch], self._y_val[batch], idx
+        return self.get_batches('val', shuffle=False)
 
     def get_epoch_test(self):
 
-        for (batch, idx) in indices_generator(shuffle=False,
-                                              batch_size=Cfg.batch_size,
-                                              n=self.n_test):
-            yield self._X_test[batch], self._y_test[batch], idx
+        return self.get_batches('test', shuffle=False)
 
     def get_epoch(self, which_set):
 
         assert which_set in ('train', 'val', 'test')
 
-        if which_set == 'train':
-            return self.get_epoch_train()
-
-        if which_set == 'val':
-            return self.get_epoch_val()
-
-        if which_set == 'test':
-            return self.get_epoch_test()
+        # evaluation passes keep the samples of each batch together, such that scores are stored
+        # at the position of their sample. in-memory train batches come in shuffled order as before
+        if which_set == 'train' and self.on_memory:
+            return self.get_batches(which_set, shuffle=True, shuffle_samples=False)
+
+        return self.get_batches(which_set, shuffle=False)
+
+    def get_batches(self, which_set, shuffle=False, shuffle_samples=False):
+        """
+        prefetched (inputs, targets, batch index) batches for one pass over which_set.
+        shuffle permutes the order of the batches, with shuffle_samples also the samples
+        (streamed data always shuffles samples through its buffer)
+        """
+
+        X = getattr(self, "_X_" + which_set)
+        y = getattr(self, "_y_" + which_set)
+
+        if not self.on_memory:
+            batches = X.iterate_batches(y, Cfg.batch_size, shuffle=shuffle,
+                                        buffer_size=Cfg.stream_buffer_size)
+        else:
+            # batches prepared ahead, the one being computed and the one being
+            # gathered must not share a buffer
+            batches = iterate_batches(X, y, Cfg.batch_size, shuffle=shuffle,
+                                      shuffle_samples=shuffle_samples,
+                                      n_buffers=Cfg.prefetch_depth + 2)
+
+        return prefetch(batches, Cfg.prefetch_depth, self.wait_stats)
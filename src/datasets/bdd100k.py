@@ -9,6 +9,9 @@ import os
 import numpy as np
 import cPickle as pickle
 from loadbdd100k import load_bdd100k_data_attribute_spec, load_bdd100k_data_filename_list
+from datasets.decoding import decode_images
+from datasets.shards import read_images
+from datasets.pyramid import pyramid_reader
 
 
 class BDD100K_DataLoader(DataLoader):
@@ -65,48 +68,38 @@ class BDD100K_DataLoader(DataLoader):
 
         print("Loading data...")
 
-        # load normal and outlier data
+        # choose the image files of each split first, then decode only those
         if Cfg.bdd100k_use_file_lists:
-            self._X_train, self._X_val, self._X_test, self._y_test = load_bdd100k_data_filename_list(self.data_path, self.norm_filenames, self.out_filenames, self.n_train, self.n_val, self.n_test, self.out_frac, self.image_height, self.image_width, self.channels)
+            train_files, val_files, test_files, self._y_test = load_bdd100k_data_filename_list(self.data_path, self.norm_filenames, self.out_filenames, self.n_train, self.n_val, self.n_test, self.out_frac, self.image_height, self.image_width, self.channels, files_only=True)
         else:
-            self._X_train, self._X_val, self._X_test, self._y_test = load_bdd100k_data_attribute_spec(self.data_path, self.attributes_normal, self.attributes_outlier, self.label_path, self.n_train, self.n_val, self.n_test, self.out_frac, self.image_height, self.image_width, self.channels, save_name_lists = True)
+            train_files, val_files, test_files, self._y_test = load_bdd100k_data_attribute_spec(self.data_path, self.attributes_normal, self.attributes_outlier, self.label_path, self.n_train, self.n_val, self.n_test, self.out_frac, self.image_height, self.image_width, self.channels, save_name_lists = True, files_only=True)
 
-        # tranpose to channels first
-        self._X_train = np.moveaxis(self._X_train,-1,1)
-        self._X_val = np.moveaxis(self._X_val,-1,1)
-        self._X_test = np.moveaxis(self._X_test,-1,1)
-
-
-        # cast data properly
-        self._X_train = self._X_train.astype(np.float32)
-        self._X_val = self._X_val.astype(np.float32)
-        self._X_test = self._X_test.astype(np.float32)
-        self._y_test = self._y_test.astype(np.int32)
+        if Cfg.ad_experiment:
+            # shuffle the file lists to obtain random validation splits, such
+            # that the images are decoded directly in their final order
+            train_files, val_files = self.permute_files(train_files, val_files)
+
+        # decode straight into channels first float32 arrays (from the packed image folder if Cfg.use_packed_data)
+        image_shape = (self.image_height, self.image_width, self.channels)
+        decode = read_images if Cfg.use_packed_data else decode_images
+        if Cfg.use_image_pyramid and not original_scale:
+            # read the level of image_shape from the cached image pyramid of the image folder
+            assert not Cfg.use_packed_data, "image pyramids are built from the image folders, not from packs"
+            decode = pyramid_reader(Cfg.pyramid_base_shape, Cfg.pyramid_n_levels, Cfg.data_cache_dir)
+        self._X_train = decode(train_files, image_shape, n_jobs=Cfg.n_decode_workers, name="train",
+                               channels_first=True, thumbnail=True)
+        self._X_val = decode(val_files, image_shape, n_jobs=Cfg.n_decode_workers, name="val",
+                             channels_first=True, thumbnail=True)
+        self._X_test = decode(test_files, image_shape, n_jobs=Cfg.n_decode_workers, name="test",
+                              channels_first=True, thumbnail=True)
 
         # Train and val labels are 0, since all are normal class
         self._y_train = np.zeros((len(self._X_train),),dtype=np.int32)
         self._y_val = np.zeros((len(self._X_val),),dtype=np.int32)
 
         if Cfg.ad_experiment:
-            # shuffle to obtain random validation splits
-            np.random.seed(self.seed)
-
-            # shuffle data (since batches are extracted block-wise)
             self.n_train = len(self._y_train)
             self.n_val = len(self._y_val)
-            perm_train = np.random.permutation(self.n_train)
-            perm_val = np.random.permutation(self.n_val)
-            self._X_train = self._X_train[perm_train]
-            self._y_train = self._y_train[perm_train]
-            self._X_val = self._X_train[perm_val]
-            self._y_val = self._y_train[perm_val]
-
-            # Subset train set such that we only get batches of the same size
-            assert(self.n_train >= Cfg.batch_size)
-            self.n_train = (self.n_train / Cfg.batch_size) * Cfg.batch_size
-            subset = np.random.choice(len(self._X_train), self.n_train, replace=False)
-            self._X_train = self._X_train[subset]
-            self._y_train = self._y_train[subset]
 
             # Adjust number of batches
             Cfg.n_batches = int(np.ceil(self.n_train * 1. / Cfg.batch_size))
@@ -114,23 +107,9 @@ class BDD100K_DataLoader(DataLoader):
         # normalize data (if original scale should not be preserved)
         if not original_scale:
 
-            # simple rescaling to [0,1]
-            normalize_data(self._X_train, self._X_val, self._X_test, scale=np.float32(255))
-
-            # global contrast normalization
-            if Cfg.gcn:
-                global_contrast_normalization(self._X_train, self._X_val, self._X_test, scale=Cfg.unit_norm_used)
-
-            # ZCA whitening
-            if Cfg.zca_whitening:
-                self._X_train, self._X_val, self._X_test = zca_whitening(self._X_train, self._X_val, self._X_test)
-
-            # rescale to [0,1] (w.r.t. min and max in train data)
-            rescale_to_unit_interval(self._X_train, self._X_val, self._X_test)
-
-            # PCA
-            if Cfg.pca:
-                self._X_train, self._X_val, self._X_test = pca(self._X_train, self._X_val, self._X_test, 0.95)
+            # rescaling to [0,1], global contrast normalization, ZCA whitening, rescaling to [0,1]
+            # (w.r.t. min and max in train data) and PCA, with statistics fitted on the train data
+            self.preprocess()
 
         flush_last_line()
         print("Data loaded.")
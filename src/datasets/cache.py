@@ -0,0 +1,205 @@
+import os
+import time
+import fcntl
+import errno
+import shutil
+import hashlib
+import numpy as np
+import cPickle as pickle
+
+
+# bump whenever the layout or the meaning of cached arrays changes
+CACHE_VERSION = 5
+
+cached_arrays = ('_X_train', '_y_train', '_X_val', '_y_val', '_X_test', '_y_test')
+
+
+def cache_key(file_lists, **params):
+    """
+    hash the input files and the parameters that determine a preprocessed
+    dataset. every file contributes its path, size and modification time, so
+    a key (and thereby its cache entry) is invalidated when any input changes.
+    """
+
+    sha = hashlib.sha1()
+    sha.update("version=%d;" % CACHE_VERSION)
+
+    for key in sorted(params):
+        sha.update("%s=%r;" % (key, params[key]))
+
+    for filenames in file_lists:
+        sha.update("[%d]" % len(filenames))
+        for filename in filenames:
+            stat = os.stat(filename)
+            sha.update("%s:%d:%r;" % (filename, stat.st_size, stat.st_mtime))
+
+    return sha.hexdigest()
+
+
+def array_key(arrays, chunk_bytes=1 << 24, **params):
+    """
+    hash the contents of in-memory arrays and the parameters of a result
+    computed from them (e.g. a fitted projection), for data without input files
+    """
+
+    sha = hashlib.sha1()
+    sha.update("version=%d;" % CACHE_VERSION)
+
+    for key in sorted(params):
+        sha.update("%s=%r;" % (key, params[key]))
+
+    for X in arrays:
+        sha.update("%s%r;" % (X.dtype.str, X.shape))
+        X_flat = X.reshape(-1)
+        step = max(1, chunk_bytes // max(X.dtype.itemsize, 1))
+        for start in range(0, len(X_flat), step):
+            sha.update(np.ascontiguousarray(X_flat[start:start + step]).tostring())
+
+    return sha.hexdigest()
+
+
+def sample_set_key(X, chunk_size=256, **params):
+    """
+    hash the set of samples in X (independent of their order) and params.
+    X is read in chunks, so any array-like with numpy indexing works.
+    """
+
+    digests = []
+    for start in range(0, len(X), chunk_size):
+        X_chunk = np.ascontiguousarray(X[start:start + chunk_size])
+        digests.extend(hashlib.sha1(x.tostring()).digest() for x in X_chunk)
+
+    sha = hashlib.sha1()
+    sha.update("version=%d;" % CACHE_VERSION)
+
+    for key in sorted(params):
+        sha.update("%s=%r;" % (key, params[key]))
+
+    sha.update("%s%r;" % (np.dtype(X.dtype).str, tuple(X.shape[1:])))
+    for digest in sorted(digests):
+        sha.update(digest)
+
+    return sha.hexdigest()
+
+
+def cache_path(cache_dir, key):
+
+    return os.path.join(cache_dir, key)
+
+
+def lock_entry(cache_dir, key):
+    """
+    exclusively lock cache entry key, waiting while another process holds the
+    lock. returns the lock file, the lock is released when it is closed (or
+    when the process exits). used so that concurrent runs wait for one run to
+    prepare an entry instead of all preparing it.
+    """
+
+    try:
+        os.makedirs(cache_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    lock_file = open(cache_path(cache_dir, key) + ".lock", 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        print("Waiting for another run to prepare %s..." % cache_path(cache_dir, key))
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+    return lock_file
+
+
+def load_cached(cache_dir, key):
+    """
+    open all arrays of cache entry key memory-mapped (read-only, zero-copy).
+    returns a dict name -> array, or None if there is no complete entry.
+    """
+
+    path = cache_path(cache_dir, key)
+    if not os.path.exists(os.path.join(path, "meta.p")):
+        return None
+
+    start_time = time.time()
+    arrays = dict()
+    for filename in os.listdir(path):
+        if filename.endswith(".npy"):
+            arrays[filename[:-4]] = np.load(os.path.join(path, filename), mmap_mode='r')
+
+    with open(os.path.join(path, "meta.p"), 'rb') as f:
+        arrays['meta'] = pickle.load(f)
+
+    print("Opened cached dataset %s (%.2fs)" % (path, time.time() - start_time))
+
+    return arrays
+
+
+def save_cached(cache_dir, key, arrays, meta=None):
+    """
+    write arrays (dict name -> array) as .npy files of cache entry key.
+    the entry is written to a temporary directory first and renamed when
+    complete, so concurrent runs never see a partially written entry.
+    """
+
+    path = cache_path(cache_dir, key)
+    if os.path.exists(path):
+        return path
+
+    tmp_path = "%s.tmp%d" % (path, os.getpid())
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    for name, X in arrays.items():
+        np.save(os.path.join(tmp_path, name + ".npy"), X)
+
+    # meta file marks the entry as complete
+    with open(os.path.join(tmp_path, "meta.p"), 'wb') as f:
+        pickle.dump(meta if meta is not None else {}, f)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process stored the same entry in the meantime
+        shutil.rmtree(tmp_path)
+
+    print("Stored dataset in cache %s" % path)
+
+    return path
+
+
+def load_cached_object(cache_dir, key):
+    """
+    unpickle the object stored under key, or None if there is none
+    """
+
+    filename = cache_path(cache_dir, key) + ".p"
+    if not os.path.exists(filename):
+        return None
+
+    with open(filename, 'rb') as f:
+        obj = pickle.load(f)
+
+    print("Loaded %s from cache" % filename)
+
+    return obj
+
+
+def save_cached_object(cache_dir, key, obj):
+    """
+    pickle obj under key. written to a temporary file and renamed when complete.
+    """
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    filename = cache_path(cache_dir, key) + ".p"
+    tmp_filename = "%s.tmp%d" % (filename, os.getpid())
+    with open(tmp_filename, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_filename, filename)
+
+    print("Stored %s in cache" % filename)
+
+    return filename
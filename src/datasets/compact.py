@@ -0,0 +1,184 @@
+import numpy as np
+
+from config import Configuration as Cfg
+
+
+class CompactArray(object):
+    """
+    Dataset split kept in compact storage (uint8 or float16) together with a
+    per-sample scale and offset. Indexing returns float32 samples
+    X[idx] * scale[idx] + offset[idx], i.e. the normalization is applied
+    only to the samples of a batch when they are requested.
+    """
+
+    def __init__(self, data, scale, offset):
+
+        self.data = data
+        self.scale = np.asarray(scale, dtype=np.float32).reshape((len(data),) + (1,) * (data.ndim - 1))
+        self.offset = np.asarray(offset, dtype=np.float32).reshape((len(data),) + (1,) * (data.ndim - 1))
+
+    def __len__(self):
+
+        return len(self.data)
+
+    @property
+    def shape(self):
+
+        return self.data.shape
+
+    @property
+    def ndim(self):
+
+        return self.data.ndim
+
+    @property
+    def size(self):
+
+        return self.data.size
+
+    @property
+    def dtype(self):
+
+        return np.dtype(np.float32)
+
+    def __getitem__(self, key):
+
+        # only the sample axis may be indexed, further axes are kept whole
+        if isinstance(key, tuple):
+            assert all(k is Ellipsis or (isinstance(k, slice) and k == slice(None)) for k in key[1:]), \
+                "CompactArray only supports indexing along the sample axis"
+            key = key[0]
+
+        X = self.data[key].astype(np.float32)
+        X *= self.scale[key]
+        X += self.offset[key]
+
+        return X
+
+    def __array__(self, dtype=None):
+
+        # materializes the full float32 split, only meant for small sets
+        X = self[:]
+        if dtype is not None:
+            X = X.astype(dtype)
+
+        return X
+
+    def reshape(self, *shape):
+
+        return np.asarray(self).reshape(*shape)
+
+
+def _gcn_statistics(X, scale="std", chunk_size=256):
+    """
+    per-sample mean and scale of global contrast normalization of X / 255,
+    computed in chunks to bound the size of float32 temporaries.
+    """
+
+    n = len(X)
+    means = np.empty(n, dtype=np.float32)
+    scales = np.empty(n, dtype=np.float32)
+    axes = tuple(range(1, X.ndim))
+
+    for start in range(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        X_chunk = X[start:stop].astype(np.float32)
+        X_chunk /= np.float32(255)
+
+        X_mean = np.mean(X_chunk, axis=axes, dtype=np.float32)
+        X_chunk -= X_mean.reshape((-1,) + (1,) * len(axes))
+
+        if scale == "std":
+            X_scale = np.std(X_chunk, axis=axes, dtype=np.float32)
+        if scale == "l1":
+            X_scale = np.sum(np.absolute(X_chunk), axis=axes, dtype=np.float32)
+        if scale == "l2":
+            X_scale = np.sqrt(np.sum(X_chunk ** 2, axis=axes, dtype=np.float32))
+
+        means[start:stop] = X_mean
+        scales[start:stop] = X_scale
+
+    return means, scales
+
+
+def _min_max(X, scale, offset, chunk_size=256):
+    """
+    minimum and maximum of X * scale + offset (per-sample scale and offset)
+    """
+
+    X_min, X_max = np.inf, -np.inf
+    shape = (-1,) + (1,) * (X.ndim - 1)
+
+    for start in range(0, len(X), chunk_size):
+        stop = min(len(X), start + chunk_size)
+        X_chunk = X[start:stop].astype(np.float32)
+        X_chunk *= scale[start:stop].reshape(shape)
+        X_chunk += offset[start:stop].reshape(shape)
+        X_min = min(X_min, np.min(X_chunk))
+        X_max = max(X_max, np.max(X_chunk))
+
+    return np.float32(X_min), np.float32(X_max)
+
+
+def compact_normalization(X_train, X_val, X_test, storage="uint8", gcn=False, gcn_scale="std", chunk_size=256):
+    """
+    Normalize uint8 image data like normalize_data (scale 255),
+    global_contrast_normalization (if gcn) and rescale_to_unit_interval,
+    but keep the data compact:
+
+    "uint8":   the raw pixels are kept, all three steps are folded into one
+               per-sample scale and offset applied at batch time.
+    "float16": the data is stored as float16 after global contrast
+               normalization, the rescaling is applied at batch time.
+
+    Returns a CompactArray for each of train, val and test.
+    """
+
+    assert storage in ("uint8", "float16")
+    assert gcn_scale in ("std", "l1", "l2")
+
+    splits = (X_train, X_val, X_test)
+
+    # per-sample affine map x / 255 -> (x / 255 - mean) / scale
+    affine = []
+    for X in splits:
+        if gcn:
+            means, scales = _gcn_statistics(X, scale=gcn_scale, chunk_size=chunk_size)
+        else:
+            means, scales = np.zeros(len(X), dtype=np.float32), np.ones(len(X), dtype=np.float32)
+        affine.append((1. / (np.float32(255) * scales), -means / scales))
+
+    if storage == "float16":
+        stored = []
+        for X, (a, b) in zip(splits, affine):
+            X_half = np.empty(X.shape, dtype=np.float16)
+            shape = (-1,) + (1,) * (X.ndim - 1)
+            for start in range(0, len(X), chunk_size):
+                stop = min(len(X), start + chunk_size)
+                X_chunk = X[start:stop].astype(np.float32)
+                X_chunk *= a[start:stop].reshape(shape)
+                X_chunk += b[start:stop].reshape(shape)
+                X_half[start:stop] = X_chunk
+            stored.append(X_half)
+        splits = stored
+        affine = [(np.ones(len(X), dtype=np.float32), np.zeros(len(X), dtype=np.float32)) for X in splits]
+
+    # rescale to [0,1] w.r.t. min and max in train data
+    X_min, X_max = _min_max(splits[0], affine[0][0], affine[0][1], chunk_size=chunk_size)
+    X_range = X_max - X_min
+
+    return tuple(CompactArray(X, (a / X_range).astype(np.float32), ((b - X_min) / X_range).astype(np.float32))
+                 for X, (a, b) in zip(splits, affine))
+
+
+def compact_storage_dtype():
+    """
+    dtype in which decoded images are held, depending on Cfg.data_storage
+    """
+
+    assert Cfg.data_storage in ("float32", "uint8", "float16")
+
+    if Cfg.data_storage == "float32":
+        return np.float32
+
+    return np.uint8
@@ -0,0 +1,51 @@
+import time
+import numpy as np
+
+
+def k_center_greedy(X, k, chunk_size=4096, seed=0):
+    """
+    indices of k samples of the embeddings X (n, d) chosen by greedy k-center
+    selection: starting from a random sample, the sample farthest from all
+    chosen ones is added until k are chosen (a 2-approximation of the minimal
+    covering radius). squared distances are computed chunk-wise as
+    |x|^2 - 2 x.c + |c|^2. returns the sorted indices and the covering radius.
+    """
+
+    n = len(X)
+    assert 0 < k <= n
+
+    X = np.asarray(X, dtype=np.float32).reshape(n, -1)
+    sq_norms = np.einsum('ij,ij->i', X, X)
+    min_dist = np.full(n, np.inf, dtype=np.float32)
+
+    idx = np.empty(k, dtype=np.int64)
+    idx[0] = np.random.RandomState(seed).randint(n)
+    for i in range(k):
+        center = X[idx[i]]
+        for start in range(0, n, chunk_size):
+            stop = min(n, start + chunk_size)
+            dist = np.dot(X[start:stop], center)
+            dist *= -2
+            dist += sq_norms[start:stop]
+            dist += sq_norms[idx[i]]
+            np.minimum(min_dist[start:stop], dist, out=min_dist[start:stop])
+        if i + 1 < k:
+            idx[i + 1] = np.argmax(min_dist)
+
+    radius = np.sqrt(max(float(min_dist.max()), 0.))
+
+    return np.sort(idx), radius
+
+
+def select_coreset(X, k, seed=0, name=""):
+    """
+    k_center_greedy() with a report of the selection
+    """
+
+    start_time = time.time()
+    idx, radius = k_center_greedy(X, k, seed=seed)
+
+    print("Selected a coreset of %d of %d %s samples (%.1f%%, covering radius %.4f, %.2fs)"
+          % (k, len(X), name, 100. * k / len(X), radius, time.time() - start_time))
+
+    return idx
@@ -0,0 +1,208 @@
+import os
+import time
+import ctypes
+import threading
+import numpy as np
+import multiprocessing as mp
+
+from multiprocessing.pool import ThreadPool
+from functools import partial
+from PIL import Image
+
+
+# output array and load function of the current job, attached once per worker process
+_worker_out = {}
+
+
+def load_image(filename, size=None, thumbnail=False):
+    """
+    decode an image file to a float32 array (height, width, channels).
+    equivalent to img_to_array(load_img(filename)) from keras.
+
+    size: (width, height) the image is resized to (exactly, or if thumbnail to
+          fit into it while keeping its aspect ratio). If size is at most half
+          of the source size, JPEGs are decoded at a reduced scale (1/2, 1/4 or
+          1/8, such that the result is still at least as large as the target)
+          before the final resize, which is much faster than a full decode.
+    """
+
+    img = Image.open(filename)
+
+    if size is not None:
+        target = thumbnail_size(img.size, size) if thumbnail else tuple(size)
+        if target != img.size:
+            img.draft('RGB', target)
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    if size is not None:
+        if thumbnail:
+            img.thumbnail(size)
+        elif img.size != tuple(size):
+            img = img.resize(tuple(size), Image.BICUBIC)
+
+    return np.asarray(img, dtype=np.float32)
+
+
+def thumbnail_size(image_size, size):
+    """
+    size of an image of image_size (width, height) shrunk by Image.thumbnail to fit into size
+    """
+
+    x, y = image_size
+    if x > size[0]:
+        y = int(max(y * size[0] / x, 1))
+        x = int(size[0])
+    if y > size[1]:
+        x = int(max(x * size[1] / y, 1))
+        y = int(size[1])
+
+    return x, y
+
+
+def select_files(folder, n=None, seed=0):
+    """
+    list the files in folder in sorted (deterministic) order and, if n is
+    smaller than the number of files, draw a seeded random subset of n files.
+    only the returned files need to be decoded. the subset keeps sorted order.
+    """
+
+    filenames = sorted(os.listdir(folder))
+
+    if n is not None and n < len(filenames):
+        rng = np.random.RandomState(seed)
+        idx = np.sort(rng.choice(len(filenames), n, replace=False))
+        filenames = [filenames[i] for i in idx]
+
+    return [os.path.join(folder, filename) for filename in filenames]
+
+
+def shared_array(shape, dtype=np.float32):
+    """
+    allocate a numpy array backed by shared memory, such that forked worker
+    processes can write into it directly.
+    """
+
+    dtype = np.dtype(dtype)
+    n_bytes = int(np.prod(shape)) * dtype.itemsize
+    buf = mp.RawArray(ctypes.c_char, max(n_bytes, 1))
+
+    return buf, np.frombuffer(buf, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def _init_worker(buf, shape, dtype, write):
+
+    _worker_out['X'] = np.frombuffer(buf, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    _worker_out['write'] = write
+
+
+def _run_task(task):
+
+    _worker_out['write'](_worker_out['X'], task)
+
+
+def parallel_write(tasks, shape, write, dtype=np.float32, n_jobs=0):
+    """
+    allocate an array of the given shape and dtype and call write(X, task) for
+    all tasks, in parallel worker processes which write straight into the
+    output array (shared memory). returns X and the number of workers.
+    forking a process which runs further threads (e.g. StreamingArray batches
+    decoded on the prefetch thread) can deadlock in the child, so then the
+    tasks run in worker threads instead (image decoding releases the GIL).
+
+    n_jobs: number of workers (0 uses all cores, 1 writes serially)
+    """
+
+    if n_jobs <= 0:
+        n_jobs = mp.cpu_count()
+    n_jobs = min(n_jobs, len(tasks))
+
+    if n_jobs <= 1:
+        X = np.empty(shape, dtype=dtype)
+        for task in tasks:
+            write(X, task)
+    elif threading.active_count() > 1:
+        X = np.empty(shape, dtype=dtype)
+        pool = ThreadPool(n_jobs)
+        try:
+            for _ in pool.imap_unordered(partial(write, X), tasks):
+                pass
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        buf, X = shared_array(shape, dtype)
+
+        # workers are forked, so write does not need to be picklable
+        pool = mp.Pool(n_jobs, initializer=_init_worker, initargs=(buf, shape, X.dtype.str, write))
+        try:
+            for _ in pool.imap_unordered(_run_task, tasks):
+                pass
+        finally:
+            pool.close()
+            pool.join()
+
+    return X, max(n_jobs, 1)
+
+
+def parallel_fill(items, item_shape, load, dtype=np.float32, n_jobs=0, chunk_size=16):
+    """
+    fill a preallocated array of shape (len(items),) + item_shape and the given
+    dtype with load(item) for all items, in parallel worker processes which
+    write straight into their slots of the output array (shared memory), so
+    X[i] always corresponds to items[i]. returns X and the number of workers.
+
+    n_jobs: number of worker processes (0 uses all cores, 1 loads serially)
+    """
+
+    n = len(items)
+    chunks = [(i, items[i:i + chunk_size]) for i in range(0, n, chunk_size)]
+
+    def fill_chunk(X, chunk):
+        start, chunk_items = chunk
+        for i, item in enumerate(chunk_items):
+            # the assignment casts to the dtype of X
+            X[start + i] = load(item)
+
+    return parallel_write(chunks, (n,) + tuple(item_shape), fill_chunk, dtype=dtype, n_jobs=n_jobs)
+
+
+def _load_stored(filename, channels_first, size, thumbnail):
+
+    img = load_image(filename, size, thumbnail)
+    if channels_first:
+        img = np.moveaxis(img, -1, 0)
+
+    return img
+
+
+def decode_images(filenames, image_shape, dtype=np.float32, n_jobs=0, chunk_size=16, name="", verbose=True,
+                  channels_first=False, thumbnail=False):
+    """
+    decode the images in filenames in parallel into a preallocated array of
+    shape (len(filenames),) + image_shape and the given dtype (see parallel_fill),
+    so X[i] always corresponds to filenames[i].
+
+    image_shape: (height, width, channels) of the decoded images
+    n_jobs: number of worker processes (0 uses all cores, 1 decodes serially)
+    channels_first: return a (n, channels, height, width) array, each image is
+                    transposed when it is written, so no full-size copy is made
+    thumbnail: shrink every image to fit into (width, height) before storing it,
+               otherwise images of another size are resized to (width, height)
+    """
+
+    height, width, channels = image_shape
+    item_shape = (channels, height, width) if channels_first else (height, width, channels)
+    load = partial(_load_stored, channels_first=channels_first, size=(width, height), thumbnail=thumbnail)
+
+    start_time = time.time()
+    X, n_jobs = parallel_fill(filenames, item_shape, load, dtype=dtype, n_jobs=n_jobs, chunk_size=chunk_size)
+    n = len(filenames)
+
+    elapsed = time.time() - start_time
+    if verbose:
+        print("Decoded %d %s images in %.2fs (%.1f images/sec, %d workers)"
+              % (n, name, elapsed, n / max(elapsed, 1e-8), n_jobs))
+
+    return X
@@ -0,0 +1,82 @@
+import time
+import binascii
+import numpy as np
+
+
+def average_hash(X, hash_size=8, chunk_size=1024):
+    """
+    perceptual (average) hashes of the images X (n, channels, height, width):
+    the grayscale image is area downsampled to hash_size x hash_size and every
+    bit tells whether a cell is brighter than the mean of the image. returns
+    the hashes packed into bytes (n, hash_size ** 2 / 8) as uint8.
+    """
+
+    n, channels, height, width = X.shape
+    assert height >= hash_size and width >= hash_size
+
+    # cell of every row and column, so sizes which are no multiple of hash_size work as well
+    rows = np.arange(height) * hash_size // height
+    cols = np.arange(width) * hash_size // width
+    row_starts = np.searchsorted(rows, np.arange(hash_size))
+    col_starts = np.searchsorted(cols, np.arange(hash_size))
+    cell_size = np.outer(np.bincount(rows), np.bincount(cols)).astype(np.float32)
+
+    hashes = np.empty((n, (hash_size ** 2 + 7) // 8), dtype=np.uint8)
+    for start in range(0, n, chunk_size):
+        gray = X[start:start + chunk_size].astype(np.float32).mean(axis=1)
+        cells = np.add.reduceat(np.add.reduceat(gray, row_starts, axis=1), col_starts, axis=2) / cell_size
+        bits = cells.reshape(len(cells), -1) > cells.mean(axis=(1, 2))[:, None]
+        hashes[start:start + len(bits)] = np.packbits(bits, axis=1)
+
+    return hashes
+
+
+def near_duplicates(hashes, max_distance):
+    """
+    mask of the hashes (in frame order) of near-duplicate frames: a frame is a
+    near-duplicate if it is within max_distance bits of the last kept frame.
+    so a static scene collapses to its first frame, and of a slowly drifting
+    scene (e.g. a pan) a frame is kept whenever it moved more than
+    max_distance bits away from the last kept one. the packed hashes are
+    scanned once as integers, compared by the popcount of their xor.
+    """
+
+    duplicate = np.zeros(len(hashes), dtype=bool)
+    if max_distance < 0 or len(hashes) == 0:
+        return duplicate
+
+    values = [int(binascii.hexlify(h.tobytes()), 16) for h in np.ascontiguousarray(hashes, dtype=np.uint8)]
+
+    kept = values[0]
+    for i in range(1, len(values)):
+        if bin(values[i] ^ kept).count("1") <= max_distance:
+            duplicate[i] = True
+        else:
+            kept = values[i]
+
+    return duplicate
+
+
+def unique_images(X, max_distance, order=None, hash_size=8, name=""):
+    """
+    sorted indices of the images of X to keep without near-duplicates, which
+    are found by the average hashes (see near_duplicates). order are the
+    indices of X in frame order (e.g. of the source files) if X is permuted.
+    """
+
+    start_time = time.time()
+
+    hashes = average_hash(X, hash_size)
+    if order is None:
+        duplicate = near_duplicates(hashes, max_distance)
+    else:
+        order = np.asarray(order, dtype=np.int64)
+        duplicate = np.empty(len(X), dtype=bool)
+        duplicate[order] = near_duplicates(hashes[order], max_distance)
+    keep = np.flatnonzero(~duplicate)
+
+    print("Dropped %d of %d %s images as near-duplicates (%.1f%% smaller, max. Hamming distance %d, %.2fs)"
+          % (len(X) - len(keep), len(X), name, 100. * (len(X) - len(keep)) / max(len(X), 1), max_distance,
+             time.time() - start_time))
+
+    return keep
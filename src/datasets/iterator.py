@@ -5,16 +5,59 @@ from picklable_itertools.extras import partition_all
 
 from fuel.schemes import BatchScheme
 
-def iterate_batches(inputs, targets, batch_size, shuffle=False):
+def iterate_batches(inputs, targets, batch_size, shuffle=False, shuffle_samples=False, n_buffers=4):
+    """
+    yield (inputs, targets, batch index) for one pass over the data.
+
+    By default batches are contiguous slices, i.e. zero-copy views of ndarray
+    inputs, and shuffle only permutes the order of the batches.
+    With shuffle and shuffle_samples, the samples themselves are permuted and
+    gathered into a ring of n_buffers preallocated batch buffers which are
+    reused, so a yielded batch is only valid until n_buffers - 1 further
+    batches have been drawn.
+    """
+
+    if shuffle and shuffle_samples:
+        for batch in gather_batches(inputs, targets, batch_size, n_buffers=n_buffers):
+            yield batch
+        return
 
     n = len(targets)
 
-    for (batch, idx) in indices_generator(shuffle=shuffle,
-                                          batch_size=batch_size,
-                                          n=n):
+    for (batch, idx) in slices_generator(shuffle=shuffle,
+                                         batch_size=batch_size,
+                                         n=n):
         yield inputs[batch], targets[batch], idx
 
-def indices_generator(shuffle, batch_size, n):
+
+def gather_batches(inputs, targets, batch_size, n_buffers=4):
+    """
+    yield batches of randomly permuted samples, gathered into reused buffers
+    """
+
+    n = len(targets)
+    n_batches = int(np.ceil(n * 1. / batch_size))
+    perm = np.random.permutation(n)
+
+    # inputs other than ndarrays (e.g. CompactArray) allocate their batches themselves
+    use_buffers = isinstance(inputs, np.ndarray)
+    if use_buffers:
+        buffers = np.empty((n_buffers, batch_size) + inputs.shape[1:], dtype=inputs.dtype)
+
+    for batch_idx in range(n_batches):
+        # sorted indices within a batch read the data (e.g. memory-mapped) in order
+        idx = np.sort(perm[batch_idx * batch_size:(batch_idx + 1) * batch_size])
+
+        if use_buffers:
+            X = buffers[batch_idx % n_buffers, :len(idx)]
+            np.take(inputs, idx, axis=0, out=X)
+        else:
+            X = inputs[idx]
+
+        yield X, targets[idx], batch_idx
+
+
+def slices_generator(shuffle, batch_size, n):
 
     n_batches = int(np.ceil(n * 1. / batch_size))
     perm = np.arange(n_batches)
@@ -25,7 +68,13 @@ def indices_generator(shuffle, batch_size, n):
     for batch_idx in perm:
         start_idx = batch_idx * batch_size
         stop_idx = min(n, start_idx + batch_size)
-        yield np.arange(start_idx, stop_idx), batch_idx
+        yield slice(start_idx, stop_idx), batch_idx
+
+
+def indices_generator(shuffle, batch_size, n):
+
+    for (batch, batch_idx) in slices_generator(shuffle, batch_size, n):
+        yield np.arange(batch.start, batch.stop), batch_idx
 
 
 class MyScheme(BatchScheme):
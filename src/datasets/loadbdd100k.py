@@ -1,13 +1,17 @@
+import os
 import json
 from pathlib import Path
 import numpy as np
 import math
-from keras.preprocessing.image import load_img, img_to_array
-#from PIL import Image
 import time
+import cPickle as pickle
+from datasets.decoding import decode_images
 
-def load_bdd100k_data_attribute_spec(img_folder, norm_spec, out_spec, labels_file, n_train, n_val, n_test, out_frac, image_height, image_width, channels, save_name_lists=False, get_norm_and_out_sets = False, shuffle=False):
-    # Returns bdd100k image data in numpy ndarrays, based on attribute specification (see argument description below)
+# attributes of the images in the BDD100K labels
+label_attributes = ("weather", "scene", "timeofday")
+
+def load_bdd100k_data_attribute_spec(img_folder, norm_spec, out_spec, labels_file, n_train, n_val, n_test, out_frac, image_height, image_width, channels, save_name_lists=False, get_norm_and_out_sets = False, shuffle=False, files_only=False, n_jobs=0):
+    # Returns bdd100k image data in numpy ndarrays (channels first), based on attribute specification (see argument description below)
     #
     # img_folder: pathlib Path to directory containing BDD100K images
     # norm_spec, out_spec: Specifications of normal and outlier class, respectively. Input are nested lists of string attributes to be included in therespective datasets. Example: norm_spec = [["weather", ["clear","partly cloudy", "overcast"]],["scene", "highway"],["timeofday", "daytime"]]. Not including an attribute, i.e. no spec of weather, will include all weather conditions, i.e. equivalent of specifying all possible keys explicitly.
@@ -20,6 +24,8 @@ def load_bdd100k_data_attribute_spec(img_folder, norm_spec, out_spec, labels_fil
     # labels_file: full path of the JSON file with BDD100K labels.
     # get_norm_and_out_sets: boolean to indicate wether to return normal and outlier data in two sets (True) or train, validation and test set with test labels (False)
     # shuffle: boolean to indicate wether to shuffle data points. Default False => given same attributes and numbers of images, train, val and test sets are identical every time.
+    # files_only: return the paths of the chosen image files instead of decoded images
+    # n_jobs: number of processes decoding the images (0 uses all cores)
   
     assert_all_attributes_exist(norm_spec)
     assert_all_attributes_exist(out_spec)
@@ -34,11 +40,11 @@ def load_bdd100k_data_attribute_spec(img_folder, norm_spec, out_spec, labels_fil
         save_file_list(norm_spec, norm_filenames)
         save_file_list(out_spec, out_filenames)
            
-    return load_bdd100k_data_filename_list(img_folder, norm_filenames, out_filenames, n_train, n_val, n_test, out_frac, image_height, image_width, channels, get_norm_and_out_sets = get_norm_and_out_sets, shuffle=shuffle)
+    return load_bdd100k_data_filename_list(img_folder, norm_filenames, out_filenames, n_train, n_val, n_test, out_frac, image_height, image_width, channels, get_norm_and_out_sets = get_norm_and_out_sets, shuffle=shuffle, files_only=files_only, n_jobs=n_jobs)
 
     
-def load_bdd100k_data_filename_list(img_folder, norm_filenames, out_filenames, n_train, n_val, n_test, out_frac, image_height, image_width, channels, get_norm_and_out_sets=False, shuffle=False):
-    # Returns bdd100k image data in np.ndarrays, based on specified image filenames (see argument description below)
+def load_bdd100k_data_filename_list(img_folder, norm_filenames, out_filenames, n_train, n_val, n_test, out_frac, image_height, image_width, channels, get_norm_and_out_sets=False, shuffle=False, files_only=False, n_jobs=0):
+    # Returns bdd100k image data in np.ndarrays (channels first), based on specified image filenames (see argument description below)
     #
     # img_folder: path to directory containing BDD100K images
     # norm_filenames, out_filenames: Lists of strings with names of image files to be included in normal and outlier datasets
@@ -51,6 +57,8 @@ def load_bdd100k_data_filename_list(img_folder, norm_filenames, out_filenames, n
     # labels_file: full path of the JSON file with BDD100K labels.
     # get_norm_and_out_sets: boolean to indicate wether to return normal and outlier data in two sets (True) or train, validation and test set with test labels (False)
     # shuffle: boolean to indicate wether to shuffle data points. Default False => given same attributes and numbers of images, train, val and test sets are identical every time.
+    # files_only: return the paths of the chosen image files instead of decoded images
+    # n_jobs: number of processes decoding the images (0 uses all cores)
     
     n_out_to_choose = int(math.ceil(n_test * out_frac))
     n_norm_test = (n_test - n_out_to_choose)
@@ -58,11 +66,10 @@ def load_bdd100k_data_filename_list(img_folder, norm_filenames, out_filenames, n
     
     print("Checking for overlap between NORMAL and OUTLIER classes...")    
     # Assert there is no overlap between target and out data
-    overlap_counter = 0
-    for filename in out_filenames:
-        if filename in norm_filenames:
-            overlap_counter += 1
-            out_filenames.remove(filename)
+    norm_set = set(norm_filenames)
+    n_out = len(out_filenames)
+    out_filenames = [filename for filename in out_filenames if filename not in norm_set]
+    overlap_counter = n_out - len(out_filenames)
             
     if overlap_counter > 0:
         print("\nWARNING: overlap between NORMAL and OUTLIER class: removed %d images from OUTLIER file list\n" % overlap_counter)
@@ -102,107 +109,161 @@ def load_bdd100k_data_filename_list(img_folder, norm_filenames, out_filenames, n
         norm_chosen = np.arange(n_norm_to_choose)
         out_chosen = np.arange(n_out_to_choose)
     
-    # Keep only selected filenames
-    norm_filenames = [norm_filenames[i] for i in norm_chosen]
-    out_filenames = [out_filenames[i] for i in out_chosen]
-    
-    
-    # Specify image format
-    print("Initializing datasets...")
-    norm_data = np.ndarray(shape=(n_norm_to_choose, image_height, image_width, channels), dtype=np.int8)
-    out_data = np.ndarray(shape=(n_out_to_choose, image_height, image_width, channels), dtype=np.int8)
+    # Keep only selected filenames. Names read from file lists written on Windows end with \r
+    norm_files = [str(img_folder / norm_filenames[i].rstrip('\r')) for i in norm_chosen]
+    out_files = [str(img_folder / out_filenames[i].rstrip('\r')) for i in out_chosen]
 
-    # Load norm images
-    print("Loading NORMAL image data...")
-    start_time = time.time()
-    for i, _file in enumerate(norm_filenames):
-        img = load_img(str(img_folder / _file)[:-1])  #  this is a PIL image. [:-1] to remove \r character added by load_img
-        img.thumbnail((image_width, image_height))
-        x = img_to_array(img)  
-        norm_data[i] = x
-    print("NORMAL image data loaded (%.2fs)" % (time.time()-start_time))
-
-    # Load out images
-    print("Loading OUTLIER image data...")
-    start_time = time.time() 
-    for i, _file in enumerate(out_filenames):
-        img = load_img(str(img_folder / _file)[:-1])  # this is a PIL image. [:-1] to remove \r character added by load_img
-
-        img.thumbnail((image_width, image_height))
-        x = img_to_array(img)
-        out_data[i] = x
-    print("OUTLIER image data loaded (%.2fs)" % (time.time()-start_time))
+    # Images are shrunk to fit into the image format and decoded directly into channels first float32 arrays
+    image_shape = (image_height, image_width, channels)
 
     if get_norm_and_out_sets:
+        if files_only:
+            return norm_files, out_files
+
+        norm_data = decode_images(norm_files, image_shape, n_jobs=n_jobs, name="NORMAL", channels_first=True, thumbnail=True)
+        out_data = decode_images(out_files, image_shape, n_jobs=n_jobs, name="OUTLIER", channels_first=True, thumbnail=True)
         return norm_data, out_data
 
-    else:
-        # Divide into train, val and test sets.
-        start_time = time.time()
+    # Divide into train, val and test sets.
+    train_files = norm_files[:n_train]
+    val_files = norm_files[n_train:n_train + n_val]
+    test_files = norm_files[n_train + n_val:] + out_files
+    test_labels = np.concatenate([np.zeros((len(norm_files[n_train + n_val:]),),dtype=np.int32),np.ones((len(out_files),),dtype=np.int32)])
 
-        train_data = norm_data[:n_train] 
-        print("Generated train_data (%.2fs)" % (time.time()-start_time))
+    if files_only:
+        return train_files, val_files, test_files, test_labels
 
-        start_time = time.time()
-        val_data = norm_data[n_train:n_train + n_val]
-        print("Generated val_data (%.2fs)" % (time.time()-start_time))
+    train_data = decode_images(train_files, image_shape, n_jobs=n_jobs, name="train", channels_first=True, thumbnail=True)
+    val_data = decode_images(val_files, image_shape, n_jobs=n_jobs, name="val", channels_first=True, thumbnail=True)
+    test_data = decode_images(test_files, image_shape, n_jobs=n_jobs, name="test", channels_first=True, thumbnail=True)
+    return train_data, val_data, test_data, test_labels
 
-        start_time = time.time()
-        test_data = np.concatenate((norm_data[n_train + n_val:], out_data), axis=0)
-        print("Generated test_data (%.2fs)" % (time.time()-start_time))
 
-        start_time = time.time()
-        test_labels = np.concatenate([np.zeros((len(norm_data[n_train + n_val:])),dtype=np.int32),np.ones((len(out_data),),dtype=np.int32)])
-        print("Generated test_labels (%.2fs)" % (time.time()-start_time))
-        return train_data, val_data, test_data, test_labels
+class LabelIndex(object):
+    """
+    Compact index of the BDD100K labels: the image names and, per attribute,
+    the code of the value of every image. Attribute specifications are resolved
+    through an inverted index (attribute -> value -> sorted image indices), so
+    the matching files are found by set operations instead of scanning all entries.
+    """
 
+    def __init__(self, names, values, codes):
+
+        self.names = names  # array of the image names in the order of the labels file
+        self.values = values  # attribute -> list of values, the code of a value is its position
+        self.codes = codes  # attribute -> uint8 array with the value code of each image
+        self._inverted = {}
+
+    @classmethod
+    def from_json(cls, json_data):
+
+        names = np.array([entry["name"] for entry in json_data])
+        values = dict()
+        codes = dict()
+        for attribute in label_attributes:
+            attribute_values = [entry["attributes"][attribute] for entry in json_data]
+            values[attribute] = sorted(set(attribute_values))
+            lookup = dict((value, code) for code, value in enumerate(values[attribute]))
+            codes[attribute] = np.array([lookup[value] for value in attribute_values], dtype=np.uint8)
+
+        return cls(names, values, codes)
+
+    def inverted(self, attribute):
+        """
+        value -> sorted indices of the images with that value of attribute
+        """
+
+        if attribute not in self._inverted:
+            order = np.argsort(self.codes[attribute], kind='mergesort')
+            bounds = np.searchsorted(self.codes[attribute][order], np.arange(len(self.values[attribute]) + 1))
+            self._inverted[attribute] = dict((value, order[bounds[code]:bounds[code + 1]])
+                                             for code, value in enumerate(self.values[attribute]))
+
+        return self._inverted[attribute]
+
+    def match(self, attributes_to_choose):
+        """
+        indices (in labels file order) of the images matching an attribute
+        specification (see load_bdd100k_data_attribute_spec)
+        """
+
+        idx = np.arange(len(self.names))
+        for attribute, options in attributes_to_choose:
+            if not isinstance(options, list):
+                options = [options]
+            inverted = self.inverted(attribute)
+            # one matching option is enough (options may repeat), all attributes have to match
+            matching = [inverted[option] for option in options if option in inverted]
+            matching = np.unique(np.concatenate(matching)) if matching else np.empty(0, dtype=idx.dtype)
+            idx = np.intersect1d(idx, matching, assume_unique=True)
+
+        return idx
+
+    def matching_files(self, attributes_to_choose):
+
+        return self.names[self.match(attributes_to_choose)].tolist()
+
+    def save(self, filename, labels_stat):
+
+        with open(filename, 'wb') as f:
+            pickle.dump(dict(names=self.names, values=self.values, codes=self.codes, labels_stat=labels_stat), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_label_index(labels_file, index_file=None):
+    # Returns the LabelIndex of labels_file. The index is built once from the JSON labels and saved to index_file
+    # (default: next to the labels file), later runs load it unless the labels file changed.
+
+    if index_file is None:
+        index_file = labels_file + ".index.p"
+
+    stat = os.stat(labels_file)
+    labels_stat = (stat.st_size, stat.st_mtime)
+
+    if os.path.exists(index_file):
+        with open(index_file, 'rb') as f:
+            data = pickle.load(f)
+        if data['labels_stat'] == labels_stat:
+            return LabelIndex(data['names'], data['values'], data['codes'])
 
-def find_norm_and_out_files(labels_file, norm_spec, out_spec):
-    
     print('Loading json data ...')
     start_time = time.time()
     with open(labels_file) as json_data:
         loaded_json_data = json.load(json_data)
     print('\rLoaded json data (%.2fs)' % (time.time()-start_time))
-    
-    norm_filenames = find_matching_files(loaded_json_data, norm_spec)
+
+    index = LabelIndex.from_json(loaded_json_data)
+    try:
+        index.save(index_file, labels_stat)
+        print('Saved label index to %s' % index_file)
+    except IOError:
+        print('Could not save label index to %s' % index_file)
+
+    return index
+
+
+def find_norm_and_out_files(labels_file, norm_spec, out_spec, index_file=None):
+
+    start_time = time.time()
+    index = load_label_index(labels_file, index_file)
+
+    norm_filenames = index.matching_files(norm_spec)
     print('NORMAL filename list complete')
-    out_filenames = find_matching_files(loaded_json_data, out_spec)
-    print('OUTLIER filename list complete')
+    out_filenames = index.matching_files(out_spec)
+    print('OUTLIER filename list complete (%.3fs)' % (time.time()-start_time))
     
     return norm_filenames, out_filenames
     
 def find_matching_files(json_data, attributes_to_choose):
-    # Parses json database and returns a list with "name" entry of all items with "attribute" keys that match attributes_to_choose
+    # Returns a list with "name" entry of all items with "attribute" keys that match attributes_to_choose
     #
-    # json_data: dictionary with json data for bdd100k images
+    # json_data: dictionary with json data for bdd100k images, or its LabelIndex
     # attributes_to_choose: attribute specification, see description of *_spec arguments in function load_bdd100k_data_attribute_spec
-    
 
-    img_names = []
-    
-    print('Parsing json data...')
-    start_time = time.time()
-    
-    for entry in json_data:
-        add_flag = True
-        for attribute in attributes_to_choose:
-            if isinstance(attribute[1], list): 
-                add_flag = False
-                for option in attribute[1]: # if several attribute options are specified, one match is enough => True
-                    if entry["attributes"][attribute[0]] == option:
-                        add_flag = True
-                if not add_flag: # if no option matched, do not evaluate other attributes
-                    break
-            elif entry["attributes"][attribute[0]] != attribute[1]: # if only one option is specified, any other value => False
-                add_flag = False
-                break
-        if add_flag:
-            img_names.append(entry["name"])
-            
-    print('Parsing complete (%.2fs)' % (time.time()-start_time))
-    
-    return img_names
+    if not isinstance(json_data, LabelIndex):
+        json_data = LabelIndex.from_json(json_data)
+
+    return json_data.matching_files(attributes_to_choose)
 
 
 def save_file_list(attribute_spec, file_list):
@@ -6,6 +6,7 @@ from datasets.bdd100k import BDD100K_DataLoader
 from datasets.dreyeve import DREYEVE_DataLoader
 from datasets.prosivic import PROSIVIC_DataLoader
 from datasets.smile import SMILE_DataLoader
+from datasets.tabular import TABULAR_DataLoader
 
 def load_dataset(learner, dataset_name, pretrain=False):
 
@@ -31,6 +32,9 @@ def load_dataset(learner, dataset_name, pretrain=False):
         #data_loader = PROSIVIC_DataLoader
         data_loader = SMILE_DataLoader
 
+    if dataset_name == "tabular":
+        data_loader = TABULAR_DataLoader
+
 
     # load data with data loader
     learner.load_data(data_loader=data_loader, pretrain=pretrain)
@@ -142,23 +142,9 @@ class MNIST_DataLoader(DataLoader):
         # normalize data (if original scale should not be preserved)
         if not original_scale:
 
-            # simple rescaling to [0,1]
-            normalize_data(self._X_train, self._X_val, self._X_test, scale=np.float32(255))
-
-            # global contrast normalization
-            if Cfg.gcn:
-                global_contrast_normalization(self._X_train, self._X_val, self._X_test, scale=Cfg.unit_norm_used)
-
-            # ZCA whitening
-            if Cfg.zca_whitening:
-                self._X_train, self._X_val, self._X_test = zca_whitening(self._X_train, self._X_val, self._X_test)
-
-            # rescale to [0,1] (w.r.t. min and max in train data)
-            rescale_to_unit_interval(self._X_train, self._X_val, self._X_test)
-
-            # PCA
-            if Cfg.pca:
-                self._X_train, self._X_val, self._X_test = pca(self._X_train, self._X_val, self._X_test, 0.95)
+            # rescaling to [0,1], global contrast normalization, ZCA whitening, rescaling to [0,1]
+            # (w.r.t. min and max in train data) and PCA, with statistics fitted on the train data
+            self.preprocess()
 
         flush_last_line()
         print("Data loaded.")
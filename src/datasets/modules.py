@@ -86,3 +86,28 @@ def addConvTransposeModule(nnet, num_filters, filter_size, W_init=None, bias=Tru
         nnet.addUpscale(scale_factor=pool_size)
     elif use_maxpool:
         nnet.addMaxPool(pool_size=pool_size)
+
+
+def addDenseModule(nnet, num_units, bias=True, use_batch_norm=False, dropout=False, p_dropout=0.5):
+    """
+    add a dense module (dense layer + (leaky) ReLU) to the network
+    """
+
+    if bias is True:
+        b = Constant(0.)
+    else:
+        b = None
+
+    # build module
+    if dropout:
+        nnet.addDropoutLayer(p=p_dropout)
+
+    nnet.addDenseLayer(use_batch_norm=use_batch_norm,
+                       num_units=num_units,
+                       W=GlorotUniform(gain=(2/(1+0.01**2)) ** 0.5),  # gain adjusted for leaky ReLU with alpha=0.01
+                       b=b)
+
+    if Cfg.leaky_relu:
+        nnet.addLeakyReLU()
+    else:
+        nnet.addReLU()
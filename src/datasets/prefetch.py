@@ -0,0 +1,114 @@
+import sys
+import time
+import Queue
+import threading
+
+
+class WaitStats(object):
+    """
+    counters of how long the consuming (compute) loop waited on batches
+    """
+
+    def __init__(self):
+
+        self.reset()
+
+    def reset(self):
+
+        self.wait_time = 0.
+        self.n_batches = 0
+        self.n_stalls = 0  # batches which were not ready when requested
+
+    def add(self, wait_time, stalled):
+
+        self.wait_time += wait_time
+        self.n_batches += 1
+        self.n_stalls += int(stalled)
+
+    def __str__(self):
+
+        return "waited {:.3f}s on data ({} of {} batches not ready)".format(
+            self.wait_time, self.n_stalls, self.n_batches)
+
+
+# marks the end of the batches in the queue
+_end = object()
+
+
+class _Failure(object):
+
+    def __init__(self, exc_info):
+
+        self.exc_info = exc_info
+
+
+def prefetch(batches, depth=2, stats=None):
+    """
+    iterate over batches (any iterable), while a background thread prepares
+    the next depth batches. batches are passed on unchanged and in order.
+    exceptions of the producer are re-raised in the consuming thread.
+
+    depth: maximum number of batches prepared ahead (0 iterates synchronously)
+    stats: optional WaitStats which accumulates the time spent waiting on batches
+    """
+
+    if depth <= 0:
+        for batch in _timed(iter(batches), stats):
+            yield batch
+        return
+
+    queue = Queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # give up if the consumer stopped early (e.g. break out of the loop)
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+            put(_end)
+        except Exception:
+            put(_Failure(sys.exc_info()))
+
+    thread = threading.Thread(target=produce, name="batch-prefetch")
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            stalled = queue.empty()
+            start_time = time.time()
+            item = queue.get()
+
+            if item is _end:
+                break
+            if isinstance(item, _Failure):
+                raise item.exc_info[0], item.exc_info[1], item.exc_info[2]
+
+            if stats is not None:
+                stats.add(time.time() - start_time, stalled)
+            yield item
+    finally:
+        stop.set()
+
+
+def _timed(batches, stats):
+
+    while True:
+        start_time = time.time()
+        try:
+            batch = next(batches)
+        except StopIteration:
+            return
+        if stats is not None:
+            stats.add(time.time() - start_time, True)
+        yield batch
@@ -1,9 +1,16 @@
+import weakref
+import hashlib
 import numpy as np
+import multiprocessing as mp
+import cPickle as pickle
 
-from sklearn.decomposition import MiniBatchDictionaryLearning, PCA
-from sklearn.feature_extraction.image import PatchExtractor
+from multiprocessing.pool import ThreadPool
+from sklearn.decomposition import MiniBatchDictionaryLearning, PCA, IncrementalPCA
 from PIL import Image
 
+from datasets.cache import array_key, sample_set_key, load_cached_object, save_cached_object
+from config import Configuration as Cfg
+
 
 def center_data(X_train, X_val, X_test,
                 mode, offset=None):
@@ -116,47 +123,487 @@ def global_contrast_normalization(X_train, X_val, X_test, scale="std"):
     X_test /= X_test_scale
 
 
+def fused_normalization(X_train, X_val, X_test, scale=np.float32(255), apply_gcn=False, gcn_scale="std",
+                        n_jobs=0, chunk_bytes=1 << 22):
+    """
+    In-place equivalent of normalize_data (fixed scale), global_contrast_normalization
+    (if apply_gcn) and rescale_to_unit_interval, fused into one statistics pass
+    over the train data and one write pass over all data. Both passes process
+    cache-sized chunks of samples on n_jobs threads (0 uses all cores) and apply
+    the same float32 operations per sample, so results match the separate
+    functions.
+    """
+
+    X_train_min, X_train_max, train_gcn_stats = fused_min_max(X_train, scale=scale, apply_gcn=apply_gcn,
+                                                              gcn_scale=gcn_scale, n_jobs=n_jobs,
+                                                              chunk_bytes=chunk_bytes, return_gcn_stats=True)
+    fused_transform((X_train, X_val, X_test), X_train_min, X_train_max, scale=scale, apply_gcn=apply_gcn,
+                    gcn_scale=gcn_scale, n_jobs=n_jobs, chunk_bytes=chunk_bytes,
+                    gcn_stats=(train_gcn_stats, None, None))
+
+
+def _chunks(X, chunk_bytes):
+
+    rows = max(1, chunk_bytes // max(X.itemsize * int(np.prod(X.shape[1:])), 1))
+    return [(X, start, min(len(X), start + rows)) for start in range(0, len(X), rows)]
+
+
+def _map_chunks(fn, chunks, n_jobs):
+
+    pool = ThreadPool(n_jobs if n_jobs > 0 else mp.cpu_count())
+    try:
+        return pool.map(fn, chunks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def fused_min_max(X_train, scale=np.float32(255), apply_gcn=False, gcn_scale="std", n_jobs=0, chunk_bytes=1 << 22,
+                  return_gcn_stats=False):
+    """
+    statistics pass of fused_normalization: min and max of the train data after
+    scaling and global contrast normalization (if apply_gcn). if return_gcn_stats,
+    the per-sample GCN (mean, scale) of the train data are returned as well (None
+    without GCN), such that fused_transform does not compute them again.
+    """
+
+    assert gcn_scale in ("std", "l1", "l2")
+
+    scale = np.float32(scale)
+    gcn_stats = None
+    if apply_gcn:
+        gcn_stats = (np.empty(len(X_train), dtype=np.float32), np.empty(len(X_train), dtype=np.float32))
+
+    def min_max(chunk):
+        X, start, stop = chunk
+        if apply_gcn:
+            # per-sample statistics are needed, normalize a chunk-sized copy
+            X_chunk = X[start:stop] / scale
+            gcn_stats[0][start:stop], gcn_stats[1][start:stop] = gcn(X_chunk, scale=gcn_scale)
+        else:
+            X_chunk = X[start:stop]
+        return np.min(X_chunk), np.max(X_chunk)
+
+    bounds = _map_chunks(min_max, _chunks(X_train, chunk_bytes), n_jobs)
+    X_train_min = np.min([b[0] for b in bounds])
+    X_train_max = np.max([b[1] for b in bounds])
+
+    if not apply_gcn:
+        X_train_min = np.float32(X_train_min) / scale
+        X_train_max = np.float32(X_train_max) / scale
+
+    if return_gcn_stats:
+        return X_train_min, X_train_max, gcn_stats
+
+    return X_train_min, X_train_max
+
+
+def fused_transform(arrays, X_train_min, X_train_max, scale=np.float32(255), apply_gcn=False, gcn_scale="std",
+                    n_jobs=0, chunk_bytes=1 << 22, gcn_stats=None):
+    """
+    write pass of fused_normalization: scale, global contrast normalize (if
+    apply_gcn) and rescale w.r.t. X_train_min and X_train_max every array in place.
+    gcn_stats: per array the per-sample GCN (mean, scale) computed before (see
+               fused_min_max), or None to compute them
+    """
+
+    assert gcn_scale in ("std", "l1", "l2")
+
+    scale = np.float32(scale)
+    X_train_range = X_train_max - X_train_min
+    if gcn_stats is None:
+        gcn_stats = (None,) * len(arrays)
+
+    def normalize(chunk):
+        X, start, stop, stats = chunk
+        X_chunk = X[start:stop]
+        X_chunk /= scale
+        if apply_gcn:
+            gcn(X_chunk, scale=gcn_scale,
+                stats=None if stats is None else (stats[0][start:stop], stats[1][start:stop]))
+        X_chunk -= X_train_min
+        X_chunk /= X_train_range
+
+    # every chunk is normalized and rescaled while in cache
+    chunks = [chunk + (stats,) for X, stats in zip(arrays, gcn_stats) for chunk in _chunks(X, chunk_bytes)]
+    _map_chunks(normalize, chunks, n_jobs)
+
+
+class ZCAWhitening(object):
+    """
+    ZCA whitening fitted on train data. Epsilon parameter eps prevents division by zero.
+    Data is centered in place, the whitened data is returned.
+    """
+
+    def __init__(self, eps=0.1):
+
+        self.eps = eps
+        self.means = None
+        self.matrix = None
+
+    def fit_transform(self, X_train):
+
+        X = X_train.reshape(len(X_train), int(np.prod(X_train.shape[1:])))
+
+        # center data
+        self.means = np.mean(X, axis=0)
+        X -= self.means
+
+        # correlation matrix
+        sigma = np.dot(X.T, X) / len(X)
+
+        # SVD
+        U,S,V = np.linalg.svd(sigma)
+
+        # ZCA Whitening matrix
+        self.matrix = np.dot(U, np.dot(np.diag(1.0 / np.sqrt(S + self.eps)), U.T))
+
+        return np.dot(X, self.matrix.T).reshape(X_train.shape)
+
+    def transform(self, X):
+
+        X_flat = X.reshape(len(X), int(np.prod(X.shape[1:])))
+        X_flat -= self.means
+
+        return np.dot(X_flat, self.matrix.T).reshape(X.shape)
+
+
+def _centered_chunks(X, means, chunk_size):
+
+    for start in range(0, len(X), chunk_size):
+        stop = min(len(X), start + chunk_size)
+        yield start, stop, X[start:stop].astype(np.float32) - means
+
+
+def _covariance_dot(X, means, Q, chunk_size):
+    """
+    (X^T X / n) Q of the centered data X, accumulated over chunks
+    """
+
+    Z = np.zeros(Q.shape, dtype=np.float32)
+    for _, _, X_chunk in _centered_chunks(X, means, chunk_size):
+        Z += np.dot(X_chunk.T, np.dot(X_chunk, Q))
+
+    return Z / np.float32(len(X))
+
+
+def randomized_covariance_eigh(X, rank, n_oversamples=10, n_iter=2, chunk_size=512, seed=0):
+    """
+    means and the top rank eigenvalues S and eigenvectors U (features x rank)
+    of the covariance matrix of the (samples x features) data X, found by
+    randomized subspace iteration over chunks of X. The covariance matrix is
+    never formed, memory is O(features * rank) plus one chunk of samples.
+    """
+
+    n, d = X.shape
+    n_components = min(d, rank + n_oversamples)
+
+    # means in one chunked pass
+    means = np.zeros(d, dtype=np.float64)
+    for start in range(0, n, chunk_size):
+        means += np.sum(X[start:start + chunk_size], axis=0, dtype=np.float64)
+    means = (means / n).astype(np.float32)
+
+    # randomized subspace iteration for the range of the covariance matrix
+    rng = np.random.RandomState(seed)
+    Q = rng.standard_normal((d, n_components)).astype(np.float32)
+    for _ in range(n_iter + 1):
+        Q, _ = np.linalg.qr(_covariance_dot(X, means, Q, chunk_size))
+
+    # eigendecomposition of the covariance matrix projected onto that range
+    B = np.zeros((n_components, n_components), dtype=np.float64)
+    for _, _, X_chunk in _centered_chunks(X, means, chunk_size):
+        P = np.dot(X_chunk, Q)
+        B += np.dot(P.T, P)
+    S, V = np.linalg.eigh(B / n)
+
+    order = np.argsort(S)[::-1][:min(rank, n_components)]
+    S = np.maximum(S[order], 0).astype(np.float32)
+    U = np.dot(Q, V[:, order].astype(np.float32))
+
+    return means, S, U
+
+
+class RandomizedZCAWhitening(object):
+    """
+    Memory-bounded ZCA whitening. The (features x features) covariance matrix is
+    never formed: the eigenvectors U of its top rank eigenvalues S are found by
+    randomized subspace iteration over chunks of the centered train data and
+    the remaining spectrum is treated as zero, i.e. the whitening matrix is
+
+        W = I / sqrt(eps) + U diag(1 / sqrt(S + eps) - 1 / sqrt(eps)) U^T
+
+    which equals the dense ZCA matrix if rank covers all non-zero eigenvalues.
+    Memory is O(features * rank) plus one chunk of samples. Data is whitened in
+    place chunk by chunk and kept as float32.
+    """
+
+    def __init__(self, rank=256, eps=0.1, n_oversamples=10, n_iter=2, chunk_size=512, seed=0):
+
+        self.rank = rank
+        self.eps = eps
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.chunk_size = chunk_size
+        self.seed = seed
+
+        self.means = None
+        self.U = None
+        self.S = None
+
+    def fit(self, X_train):
+
+        X = X_train.reshape(len(X_train), int(np.prod(X_train.shape[1:])))
+        self.means, self.S, self.U = randomized_covariance_eigh(X, self.rank, n_oversamples=self.n_oversamples,
+                                                                n_iter=self.n_iter, chunk_size=self.chunk_size,
+                                                                seed=self.seed)
+
+        return self
+
+    def transform(self, X):
+
+        X_flat = X.reshape(len(X), int(np.prod(X.shape[1:])))
+
+        residual_scale = np.float32(1. / np.sqrt(self.eps))
+        coefficients = (1. / np.sqrt(self.S + self.eps) - residual_scale).astype(np.float32)
+
+        for start, stop, X_chunk in _centered_chunks(X_flat, self.means, self.chunk_size):
+            P = np.dot(X_chunk, self.U) * coefficients
+            X_chunk *= residual_scale
+            X_chunk += np.dot(P, self.U.T)
+            X_flat[start:stop] = X_chunk
+
+        return X_flat.reshape(X.shape)
+
+    def fit_transform(self, X_train):
+
+        return self.fit(X_train).transform(X_train)
+
+
 def zca_whitening(X_train, X_val, X_test, eps=0.1):
     """
      Apply ZCA whitening. Epsilon parameter eps prevents division by zero.
     """
 
-    # get shape to later reshape data to original format
-    shape_train = X_train.shape
-    shape_val = X_val.shape
-    shape_test = X_test.shape
+    zca = ZCAWhitening(eps=eps)
+    X_train = zca.fit_transform(X_train)
 
-    if X_train.ndim > 2:
-        X_train = X_train.reshape(shape_train[0], np.prod(shape_train[1:]))
-        X_val = X_val.reshape(shape_val[0], np.prod(shape_val[1:]))
-        X_test = X_test.reshape(shape_test[0], np.prod(shape_test[1:]))
+    return X_train, zca.transform(X_val), zca.transform(X_test)
 
-    # center data
-    means = np.mean(X_train, axis=0)
-    X_train -= means
-    X_val -= means
-    X_test -= means
 
-    # correlation matrix
-    sigma = np.dot(X_train.T, X_train) / shape_train[0]
+class ChunkedPCA(object):
+    """
+    PCA such that var_retained of the variance of the train data is retained,
+    fitted over chunks of the train data instead of one SVD of the full
+    (samples x features) matrix. solver "incremental" uses partial fits of
+    sklearn's IncrementalPCA, solver "randomized" randomized subspace iteration
+    over chunks (as RandomizedZCAWhitening). At most max_components components
+    are computed. Data is transformed chunk-wise into a float32 array.
+    """
 
-    # SVD
-    U,S,V = np.linalg.svd(sigma)
+    def __init__(self, var_retained=0.95, solver="randomized", max_components=512, chunk_size=1024, seed=0):
+
+        assert solver in ("incremental", "randomized")
+
+        self.var_retained = var_retained
+        self.solver = solver
+        self.max_components = max_components
+        self.chunk_size = chunk_size
+        self.seed = seed
+
+        self.mean_ = None
+        self.components_ = None
+        self.explained_variance_ratio_ = None
+
+    def fit(self, X_train):
+
+        X = X_train.reshape(len(X_train), int(np.prod(X_train.shape[1:])))
+        n, d = X.shape
+        n_components = min(self.max_components, n, d)
+
+        if self.solver == "incremental":
+            # every partial fit needs at least n_components samples, the tail is merged into the last chunk
+            chunk_size = max(self.chunk_size, n_components)
+            ipca = IncrementalPCA(n_components=n_components)
+            start = 0
+            while start < n:
+                stop = start + chunk_size if n - start >= 2 * chunk_size else n
+                ipca.partial_fit(X[start:stop].astype(np.float32))
+                start = stop
+            means = ipca.mean_
+            components = ipca.components_
+            ratio = ipca.explained_variance_ratio_
+        else:
+            means, S, U = randomized_covariance_eigh(X, n_components, chunk_size=self.chunk_size, seed=self.seed)
+            total_variance = 0.
+            for _, _, X_chunk in _centered_chunks(X, means, self.chunk_size):
+                total_variance += np.sum(X_chunk ** 2, dtype=np.float64)
+            components = U.T
+            ratio = S / (total_variance / n)
 
-    # ZCA Whitening matrix
-    ZCAMatrix = np.dot(U, np.dot(np.diag(1.0 / np.sqrt(S + eps)), U.T))
+        # smallest number of components which retains var_retained of the variance (as sklearn's PCA)
+        k = min(np.searchsorted(np.cumsum(ratio), self.var_retained, side='right') + 1, len(ratio))
+        if np.sum(ratio[:k]) < self.var_retained:
+            print("PCA: %d components retain only %.3f of the variance, increase max_components to retain %.3f"
+                  % (k, np.sum(ratio[:k]), self.var_retained))
 
-    # Whiten
-    X_train = np.dot(X_train, ZCAMatrix.T)
-    X_val = np.dot(X_val, ZCAMatrix.T)
-    X_test = np.dot(X_test, ZCAMatrix.T)
+        self.mean_ = np.asarray(means, dtype=np.float32)
+        self.components_ = np.asarray(components[:k], dtype=np.float32)
+        self.explained_variance_ratio_ = np.asarray(ratio[:k], dtype=np.float32)
 
-    # reshape to original shape
-    X_train = X_train.reshape(shape_train)
-    X_val = X_val.reshape(shape_val)
-    X_test = X_test.reshape(shape_test)
+        return self
 
-    return X_train, X_val, X_test
+    def transform(self, X):
+
+        X_flat = X.reshape(len(X), int(np.prod(X.shape[1:])))
+        X_pca = np.empty((len(X_flat), len(self.components_)), dtype=np.float32)
+
+        for start, stop, X_chunk in _centered_chunks(X_flat, self.mean_, self.chunk_size):
+            X_pca[start:stop] = np.dot(X_chunk, self.components_.T)
+
+        return X_pca
+
+
+def fit_pca(X_train, var_retained=0.95, solver="full", max_components=512, cache_dir=None):
+    """
+    fit PCA on the (flattened) train data, exactly with sklearn's PCA (solver
+    "full") or chunk-wise with ChunkedPCA (solver "incremental" or "randomized").
+    If cache_dir is given, the fitted PCA is stored there, keyed by the contents
+    of the train data, and reused by later runs on the same data.
+    """
+
+    if cache_dir is not None:
+        key = array_key([X_train], solver=solver, var_retained=var_retained, max_components=max_components)
+        projection = load_cached_object(cache_dir, "pca_" + key)
+        if projection is not None:
+            return projection
+
+    if solver == "full":
+        projection = PCA(n_components=var_retained)
+        projection.fit(X_train.reshape(len(X_train), -1))
+    else:
+        projection = ChunkedPCA(var_retained=var_retained, solver=solver, max_components=max_components)
+        projection.fit(X_train)
+
+    if cache_dir is not None:
+        save_cached_object(cache_dir, "pca_" + key, projection)
+
+    return projection
+
+
+class Preprocessor(object):
+    """
+    Fit/transform version of the preprocessing applied by the data loaders:
+    scaling to [0,1] by scale, global contrast normalization (if gcn), ZCA
+    whitening (if zca, memory-bounded of rank zca_rank if > 0), rescaling to [0,1] w.r.t. min and max in train data and
+    PCA (if pca, see fit_pca for the solvers). The statistics are fitted on the train data and can be saved,
+    such that test-only runs transform the test data without the train data.
+    """
+
+    def __init__(self, scale=np.float32(255), gcn=False, gcn_scale="std", zca=False, zca_rank=0, pca=False,
+                 var_retained=0.95, pca_solver="full", pca_max_components=512, pca_cache_dir=None, n_jobs=0):
+
+        assert gcn_scale in ("std", "l1", "l2")
+
+        self.scale = np.float32(scale)
+        self.gcn = gcn
+        self.gcn_scale = gcn_scale
+        self.zca = zca
+        self.zca_rank = zca_rank  # rank of memory-bounded ZCA whitening (0 for exact dense ZCA)
+        self.pca = pca
+        self.var_retained = var_retained
+        self.pca_solver = pca_solver  # "full", "incremental" or "randomized" (see fit_pca)
+        self.pca_max_components = pca_max_components
+        self.pca_cache_dir = pca_cache_dir
+        self.n_jobs = n_jobs
+
+        # fitted statistics
+        self.X_min = None
+        self.X_max = None
+        self.zca_whitening = None
+        self.pca_projection = None
+
+    def fit_transform(self, X_train):
+
+        if self.zca:
+            self._scale_and_gcn(X_train)
+            if self.zca_rank > 0:
+                self.zca_whitening = RandomizedZCAWhitening(rank=self.zca_rank)
+            else:
+                self.zca_whitening = ZCAWhitening()
+            X_train = self.zca_whitening.fit_transform(X_train)
+            self.X_min = np.min(X_train)
+            self.X_max = np.max(X_train)
+            self._rescale(X_train)
+        else:
+            # scaling, GCN and rescaling in one pass, reusing the GCN statistics of the train data
+            self.X_min, self.X_max, gcn_stats = fused_min_max(X_train, scale=self.scale, apply_gcn=self.gcn,
+                                                              gcn_scale=self.gcn_scale, n_jobs=self.n_jobs,
+                                                              return_gcn_stats=True)
+            self._fused_transform(X_train, gcn_stats)
+
+        if self.pca:
+            print("Applying PCA...")
+            X_train = X_train.reshape(len(X_train), -1)
+            self.pca_projection = fit_pca(X_train, var_retained=self.var_retained, solver=self.pca_solver,
+                                          max_components=self.pca_max_components, cache_dir=self.pca_cache_dir)
+            X_train = self.pca_projection.transform(X_train)
+            print("PCA pre-processing finished.")
+
+        return X_train
+
+    def transform(self, X):
+        """
+        transform X with the fitted statistics. X is modified in place, use the
+        returned array (ZCA whitening and PCA return new arrays).
+        """
+
+        assert self.X_min is not None, "Preprocessor has to be fitted first"
+
+        if self.zca:
+            self._scale_and_gcn(X)
+            X = self.zca_whitening.transform(X)
+            self._rescale(X)
+        else:
+            self._fused_transform(X)
+
+        if self.pca and X.size > 0:
+            X = self.pca_projection.transform(X.reshape(len(X), -1))
+
+        return X
+
+    def _scale_and_gcn(self, X):
+
+        X /= self.scale
+        if self.gcn:
+            gcn(X, scale=self.gcn_scale)
+
+    def _rescale(self, X):
+
+        X -= self.X_min
+        X /= (self.X_max - self.X_min)
+
+    def _fused_transform(self, X, gcn_stats=None):
+
+        fused_transform((X,), self.X_min, self.X_max, scale=self.scale, apply_gcn=self.gcn,
+                        gcn_scale=self.gcn_scale, n_jobs=self.n_jobs, gcn_stats=(gcn_stats,))
+
+    def save(self, filename):
+
+        with open(filename, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        print("Preprocessing statistics saved to %s" % filename)
+
+    @staticmethod
+    def load(filename):
+
+        with open(filename, 'rb') as f:
+            preprocessor = pickle.load(f)
+
+        print("Preprocessing statistics loaded from %s" % filename)
+
+        return preprocessor
 
 
 def make_unit_norm(X_train, X_val, X_test, norm="l2"):
@@ -188,9 +635,10 @@ def make_unit_norm(X_train, X_val, X_test, norm="l2"):
     X_test /= X_test_norms
 
 
-def pca(X_train, X_val, X_test, var_retained=0.95):
+def pca(X_train, X_val, X_test, var_retained=0.95, solver="full", max_components=512, cache_dir=None):
     """
-    PCA such that var_retained of variance is retained (w.r.t. train set)
+    PCA such that var_retained of variance is retained (w.r.t. train set).
+    solver, max_components and cache_dir as in fit_pca.
     """
 
     print("Applying PCA...")
@@ -203,8 +651,8 @@ def pca(X_train, X_val, X_test, var_retained=0.95):
         if X_test.size > 0:
             X_test = X_test.reshape(X_test.shape[0], -1)
 
-    pca = PCA(n_components=var_retained)
-    pca.fit(X_train)
+    pca = fit_pca(X_train, var_retained=var_retained, solver=solver, max_components=max_components,
+                  cache_dir=cache_dir)
     X_train = pca.transform(X_train)
     if X_val.size > 0:
         X_val = pca.transform(X_val)
@@ -243,17 +691,24 @@ def downscale(image, pixels=64):
     return np.rollaxis(np.array(img.resize(size=(pixels, pixels))), 2)
 
 
-def gcn(X, scale="std"):
+def gcn(X, scale="std", stats=None):
     """
     Subtract mean across features (pixels) and normalize by scale, which is
     either the standard deviation, l1- or l2-norm across features (pixel).
     That is, normalization for each sample (image) globally across features.
+    Returns the per-sample (mean, scale), which can be passed as stats to
+    apply them again without computing them.
     """
 
     assert scale in ("std", "l1", "l2")
 
     na = np.newaxis
 
+    if stats is not None:
+        X -= stats[0][:, na, na, na]
+        X /= stats[1][:, na, na, na]
+        return stats
+
     X_mean = np.mean(X, axis=(1, 2, 3), dtype=np.float32)[:, na, na, na]
     X -= X_mean
 
@@ -269,6 +724,8 @@ def gcn(X, scale="std"):
 
     X /= X_scale
 
+    return X_mean[:, 0, 0, 0], X_scale[:, 0, 0, 0]
+
 
 def extract_norm_and_out(X, y, normal, outlier):
     '''
@@ -292,33 +749,104 @@ def extract_norm_and_out(X, y, normal, outlier):
     return X_normal, X_outlier, y_normal, y_outlier
 
 
+def sample_patches(X, patch_size, n_patches):
+    """
+    draw n_patches patches of size patch_size x patch_size at random
+    locations of random images of X (n, channels, height, width). Patches are
+    gathered from a strided view of X, so only the drawn patches are copied.
+    n_patches <= 0 returns all patches. Returns (n_patches, channels, patch_size, patch_size).
+    """
+
+    X = np.ascontiguousarray(X)
+    n, n_channels, height, width = X.shape
+    n_y, n_x = height - patch_size + 1, width - patch_size + 1
+
+    # view (n, n_y, n_x, channels, patch_size, patch_size) of all patches
+    s_n, s_c, s_h, s_w = X.strides
+    windows = np.lib.stride_tricks.as_strided(X, shape=(n, n_y, n_x, n_channels, patch_size, patch_size),
+                                              strides=(s_n, s_h, s_w, s_c, s_h, s_w), writeable=False)
+
+    if n_patches <= 0:
+        return windows.reshape(n * n_y * n_x, n_channels, patch_size, patch_size)
+
+    idx = np.random.randint(n, size=n_patches)
+    y = np.random.randint(n_y, size=n_patches)
+    x = np.random.randint(n_x, size=n_patches)
+
+    return windows[idx, y, x]
+
+
+def _train_set_key(X):
+    """
+    order-independent content key of the train data X, computed once per array
+    """
+
+    entry = _train_set_keys.get(id(X))
+    if entry is not None and entry[0]() is X:
+        return entry[1]
+
+    key = sample_set_key(X)
+    _train_set_keys[id(X)] = (weakref.ref(X), key)
+
+    return key
+
+
+# id(X) -> (weak reference to X, content key of X)
+_train_set_keys = {}
+
+
 def learn_dictionary(X, n_filters, filter_size, n_sample=1000,
-                     n_sample_patches=0, **kwargs):
+                     n_sample_patches=None, n_iter=None, **kwargs):
     """
-    learn a dictionary of n_filters atoms from n_sample images from X
+    learn a dictionary of n_filters atoms from all patches of n_sample images
+    from X, or from a budget of n_sample_patches random patches of them if > 0
+    (defaults of the budgets from Cfg).
+
+    If Cfg.cache_dictionary, the dictionary is stored in Cfg.data_cache_dir,
+    keyed by the set of samples in X and the dictionary settings, and reused
+    by later runs on the same data (other seeds, objectives or phases).
     """
 
+    if n_sample_patches is None:
+        n_sample_patches = Cfg.dict_learn_n_patches
+    if n_iter is None:
+        n_iter = Cfg.dict_learn_n_iter
+
+    if Cfg.cache_dictionary:
+        key = "dict_%s_%d_%d_%d_%d_%d" % (_train_set_key(X), n_filters, filter_size, n_sample, n_sample_patches,
+                                          n_iter)
+        if kwargs:
+            key += "_" + hashlib.sha1(repr(sorted(kwargs.items()))).hexdigest()
+        W = load_cached_object(Cfg.data_cache_dir, key)
+        if W is not None:
+            return W
+
+        W = _learn_dictionary(X, n_filters, filter_size, n_sample, n_sample_patches, n_iter, **kwargs)
+        save_cached_object(Cfg.data_cache_dir, key, W)
+
+        return W
+
+    return _learn_dictionary(X, n_filters, filter_size, n_sample, n_sample_patches, n_iter, **kwargs)
+
+
+def _learn_dictionary(X, n_filters, filter_size, n_sample, n_sample_patches, n_iter, **kwargs):
+
     n_channels = X.shape[1]
 
     # subsample n_sample images randomly
+    n_sample = min(n_sample, len(X))
     rand_idx = np.random.choice(len(X), n_sample, replace=False)
 
-    # extract patches
-    patch_size = (filter_size, filter_size)
-    patches = PatchExtractor(patch_size).transform(
-        X[rand_idx, ...].reshape(n_sample, X.shape[2], X.shape[3], X.shape[1]))
+    # sample patches (all of them unless a budget is set), normalized in the dtype of X
+    patches = sample_patches(X[rand_idx], filter_size, n_sample_patches)
     patches = patches.reshape(patches.shape[0], -1)
     patches -= np.mean(patches, axis=0)
     patches /= np.std(patches, axis=0)
 
-    if n_sample_patches > 0 and (n_sample_patches < len(patches)):
-        np.random.shuffle(patches)
-        patches = patches[:n_sample_patches, ...]
-
     # learn dictionary
-    print('Learning dictionary for weight initialization...')
+    print('Learning dictionary for weight initialization on %d patches...' % len(patches))
 
-    dico = MiniBatchDictionaryLearning(n_components=n_filters, alpha=1, n_iter=1000, batch_size=10, shuffle=True,
+    dico = MiniBatchDictionaryLearning(n_components=n_filters, alpha=1, n_iter=n_iter, batch_size=10, shuffle=True,
                                        verbose=True, **kwargs)
     W = dico.fit(patches).components_
     W = W.reshape(n_filters, n_channels, filter_size, filter_size)
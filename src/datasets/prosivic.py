@@ -8,7 +8,7 @@ from datasets.modules import addConvModule, addConvTransposeModule
 import os
 import numpy as np
 import cPickle as pickle
-from keras.preprocessing.image import load_img, img_to_array
+from datasets.decoding import select_files, decode_images
 
 class PROSIVIC_DataLoader(DataLoader):
 
@@ -57,55 +57,38 @@ class PROSIVIC_DataLoader(DataLoader):
 
         print("Loading data...")
 
-        # load normal and outlier data
-        self._X_train = [img_to_array(load_img(Cfg.prosivic_train_folder + filename)) for filename in os.listdir(Cfg.prosivic_train_folder)][:Cfg.prosivic_n_train]
-        self._X_val = [img_to_array(load_img(Cfg.prosivic_val_folder + filename)) for filename in os.listdir(Cfg.prosivic_val_folder)][:Cfg.prosivic_n_val]
+        # choose the files of each split first, then decode only those
+        image_shape = (self.image_height, self.image_width, self.channels)
         n_test_out = Cfg.prosivic_n_test - Cfg.prosivic_n_test_in
-        _X_test_in = [img_to_array(load_img(Cfg.prosivic_test_in_folder + filename)) for filename in os.listdir(Cfg.prosivic_test_in_folder)][:Cfg.prosivic_n_test_in]
-        _X_test_out = [img_to_array(load_img(Cfg.prosivic_test_out_folder + filename)) for filename in os.listdir(Cfg.prosivic_test_out_folder)][:n_test_out]
-        _y_test_in  = np.zeros((Cfg.prosivic_n_test_in,),dtype=np.int32)
-        _y_test_out = np.ones((n_test_out,),dtype=np.int32)
-        self._X_test = np.concatenate([_X_test_in, _X_test_out])
-        self._y_test = np.concatenate([_y_test_in, _y_test_out])
-        self.out_frac = Cfg.out_frac
-
-        # tranpose to channels first
-        self._X_train = np.moveaxis(self._X_train,-1,1)
-        self._X_val = np.moveaxis(self._X_val,-1,1)
-        self._X_test = np.moveaxis(self._X_test,-1,1)
+        train_files = select_files(Cfg.prosivic_train_folder, Cfg.prosivic_n_train, self.seed)
+        val_files = select_files(Cfg.prosivic_val_folder, Cfg.prosivic_n_val, self.seed)
+        test_in_files = select_files(Cfg.prosivic_test_in_folder, Cfg.prosivic_n_test_in, self.seed)
+        test_out_files = select_files(Cfg.prosivic_test_out_folder, n_test_out, self.seed)
 
+        if Cfg.ad_experiment:
+            # shuffle the file lists to obtain random validation splits, such
+            # that the images are decoded directly in their final order
+            train_files, val_files = self.permute_files(train_files, val_files)
+            print("Shuffled data")
 
-        # cast data properly
-        self._X_train = self._X_train.astype(np.float32)
-        self._X_val = self._X_val.astype(np.float32)
-        self._X_test = self._X_test.astype(np.float32)
-        self._y_test = self._y_test.astype(np.int32)
+        # decode straight into channels first float32 arrays
+        self._X_train = decode_images(train_files, image_shape, n_jobs=Cfg.n_decode_workers, name="train",
+                                      channels_first=True)
+        self._X_val = decode_images(val_files, image_shape, n_jobs=Cfg.n_decode_workers, name="val",
+                                    channels_first=True)
+        self._X_test = decode_images(test_in_files + test_out_files, image_shape, n_jobs=Cfg.n_decode_workers,
+                                     name="test", channels_first=True)
+        self._y_test = np.concatenate([np.zeros((len(test_in_files),), dtype=np.int32),
+                                       np.ones((len(test_out_files),), dtype=np.int32)])
+        self.out_frac = Cfg.out_frac
 
         # Train and val labels are 0, since all are normal class
         self._y_train = np.zeros((len(self._X_train),),dtype=np.int32)
         self._y_val = np.zeros((len(self._X_val),),dtype=np.int32)
 
         if Cfg.ad_experiment:
-            # shuffle to obtain random validation splits
-            np.random.seed(self.seed)
-
-            # shuffle data (since batches are extracted block-wise)
             self.n_train = len(self._y_train)
             self.n_val = len(self._y_val)
-            perm_train = np.random.permutation(self.n_train)
-            perm_val = np.random.permutation(self.n_val)
-            self._X_train = self._X_train[perm_train]
-            self._y_train = self._y_train[perm_train]
-            self._X_val = self._X_train[perm_val]
-            self._y_val = self._y_train[perm_val]
-            print("Shuffled data")
-
-            # Subset train set such that we only get batches of the same size
-            assert(self.n_train >= Cfg.batch_size)
-            self.n_train = (self.n_train / Cfg.batch_size) * Cfg.batch_size
-            subset = np.random.choice(len(self._X_train), self.n_train, replace=False)
-            self._X_train = self._X_train[subset]
-            self._y_train = self._y_train[subset]
 
             # Adjust number of batches
             Cfg.n_batches = int(np.ceil(self.n_train * 1. / Cfg.batch_size))
@@ -113,23 +96,9 @@ class PROSIVIC_DataLoader(DataLoader):
         # normalize data (if original scale should not be preserved)
         if not original_scale:
 
-            # simple rescaling to [0,1]
-            normalize_data(self._X_train, self._X_val, self._X_test, scale=np.float32(255))
-
-            # global contrast normalization
-            if Cfg.gcn:
-                global_contrast_normalization(self._X_train, self._X_val, self._X_test, scale=Cfg.unit_norm_used)
-
-            # ZCA whitening
-            if Cfg.zca_whitening:
-                self._X_train, self._X_val, self._X_test = zca_whitening(self._X_train, self._X_val, self._X_test)
-
-            # rescale to [0,1] (w.r.t. min and max in train data)
-            rescale_to_unit_interval(self._X_train, self._X_val, self._X_test)
-
-            # PCA
-            if Cfg.pca:
-                self._X_train, self._X_val, self._X_test = pca(self._X_train, self._X_val, self._X_test, 0.95)
+            # rescaling to [0,1], global contrast normalization, ZCA whitening, rescaling to [0,1]
+            # (w.r.t. min and max in train data) and PCA, with statistics fitted on the train data
+            self.preprocess()
 
         flush_last_line()
         print("Data loaded.")
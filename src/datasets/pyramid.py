@@ -0,0 +1,175 @@
+import os
+import time
+import shutil
+import numpy as np
+import cPickle as pickle
+
+from datasets.cache import cache_key, cache_path, load_cached
+from datasets.decoding import decode_images
+
+
+def area_downsample(X, out=None, chunk_size=256):
+    """
+    halve height and width of the images X (n, channels, height, width) by
+    averaging 2x2 blocks (area interpolation). Integer images are rounded.
+    Works chunk-wise into out (allocated with the dtype of X if None).
+    """
+
+    n, channels, height, width = X.shape
+    if out is None:
+        out = np.empty((n, channels, height // 2, width // 2), dtype=X.dtype)
+
+    for start in range(0, n, chunk_size):
+        X_chunk = X[start:start + chunk_size, :, :height // 2 * 2, :width // 2 * 2].astype(np.float32)
+        X_chunk = X_chunk.reshape(len(X_chunk), channels, height // 2, 2, width // 2, 2).mean(axis=(3, 5))
+        if np.issubdtype(out.dtype, np.integer):
+            X_chunk = np.rint(X_chunk)
+        out[start:start + len(X_chunk)] = X_chunk
+
+    return out
+
+
+def level_shapes(base_shape, n_levels):
+    """
+    (height, width, channels) of the levels of a pyramid with base level base_shape
+    """
+
+    height, width, channels = base_shape
+    return [(height >> level, width >> level, channels) for level in range(n_levels)]
+
+
+class ImagePyramid(object):
+    """
+    All images of a folder decoded once at base_shape and stored with n_levels
+    area downsampled levels (each half the size of the previous one) as uint8
+    arrays in the dataset cache. Levels are opened memory-mapped, so reading
+    images of any level has no decoding cost.
+    """
+
+    def __init__(self, folder, base_shape, n_levels=3, cache_dir="../data/cache/", thumbnail=False,
+                 decode=decode_images, n_jobs=0, block_size=1024):
+
+        self.folder = folder
+        self.base_shape = tuple(base_shape)
+        self.shapes = level_shapes(self.base_shape, n_levels)
+
+        filenames = [os.path.join(folder, filename) for filename in sorted(os.listdir(folder))]
+        key = cache_key([filenames], pyramid=True, base_shape=self.base_shape, n_levels=n_levels,
+                        thumbnail=thumbnail)
+
+        cached = load_cached(cache_dir, key)
+        if cached is None:
+            self._build(cache_dir, key, filenames, thumbnail, decode, n_jobs, block_size)
+            cached = load_cached(cache_dir, key)
+
+        self.levels = dict((shape, cached[self._name(shape)]) for shape in self.shapes)
+        self._index = dict((name, i) for i, name in enumerate(cached['meta']['sources']))
+
+    @staticmethod
+    def _name(shape):
+
+        return "level_%dx%d" % shape[:2]
+
+    def _build(self, cache_dir, key, filenames, thumbnail, decode, n_jobs, block_size):
+
+        print("Building image pyramid %s of %d images in %s..."
+              % ("/".join(str(shape[0]) for shape in self.shapes), len(filenames), self.folder))
+        start_time = time.time()
+
+        # levels are written block-wise into .npy files of a temporary entry, which is renamed when complete
+        path = cache_path(cache_dir, key)
+        tmp_path = "%s.tmp%d" % (path, os.getpid())
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        levels = [np.lib.format.open_memmap(os.path.join(tmp_path, self._name(shape) + ".npy"), mode='w+',
+                                            dtype=np.uint8, shape=(len(filenames), shape[2]) + shape[:2])
+                  for shape in self.shapes]
+
+        for start in range(0, len(filenames), block_size):
+            stop = min(len(filenames), start + block_size)
+            X = decode(filenames[start:stop], self.base_shape, dtype=np.uint8, n_jobs=n_jobs, verbose=False,
+                       channels_first=True, thumbnail=thumbnail)
+            levels[0][start:stop] = X
+            for level in range(1, len(levels)):
+                X = area_downsample(X, out=levels[level][start:stop])
+
+        for X in levels:
+            X.flush()
+        del levels
+
+        with open(os.path.join(tmp_path, "meta.p"), 'wb') as f:
+            pickle.dump(dict(sources=[os.path.basename(filename) for filename in filenames]), f)
+
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # another process built the same pyramid in the meantime
+            shutil.rmtree(tmp_path)
+
+        print("Built image pyramid (%.2fs)" % (time.time() - start_time))
+
+    def read(self, filenames, image_shape, dtype=np.float32, channels_first=True):
+        """
+        images of filenames at the pyramid level of image_shape (height, width, channels)
+        """
+
+        if tuple(image_shape) not in self.levels:
+            raise ValueError("image shape %s is not a level of the pyramid of %s (levels: %s)"
+                             % (tuple(image_shape), self.folder, ", ".join(str(s) for s in self.shapes)))
+
+        level = self.levels[tuple(image_shape)]
+        idx = np.array([self._index[os.path.basename(filename)] for filename in filenames], dtype=np.int64)
+
+        # gather in storage order for sequential reads
+        order = np.argsort(idx, kind='mergesort')
+        X = np.empty((len(idx),) + level.shape[1:], dtype=dtype)
+        X[order] = level[idx[order]]
+
+        return X if channels_first else np.moveaxis(X, 1, -1)
+
+
+# (folder, base shape, thumbnail) -> ImagePyramid
+_pyramids = {}
+
+
+def pyramid_reader(base_shape, n_levels=3, cache_dir="../data/cache/", decode=decode_images):
+    """
+    a function with the signature of decode_images which reads the images from
+    the pyramids of their folders (built on first use, see ImagePyramid).
+    decode is used to decode the base levels.
+    """
+
+    def read_images(filenames, image_shape, dtype=np.float32, n_jobs=0, name="", verbose=True,
+                    channels_first=False, thumbnail=False, **kwargs):
+
+        start_time = time.time()
+
+        height, width, channels = image_shape
+        item_shape = (channels, height, width) if channels_first else (height, width, channels)
+        X = np.empty((len(filenames),) + item_shape, dtype=dtype)
+
+        groups = dict()
+        for i, filename in enumerate(filenames):
+            groups.setdefault(os.path.normpath(os.path.dirname(filename)), []).append(i)
+
+        for folder, positions in groups.items():
+            pyramid_key = (folder, tuple(base_shape), n_levels, thumbnail)
+            if pyramid_key not in _pyramids:
+                _pyramids[pyramid_key] = ImagePyramid(folder, base_shape, n_levels=n_levels, cache_dir=cache_dir,
+                                                      thumbnail=thumbnail, decode=decode, n_jobs=n_jobs)
+            X_group = _pyramids[pyramid_key].read([filenames[i] for i in positions], image_shape, dtype=dtype,
+                                                  channels_first=channels_first)
+            if len(groups) == 1:
+                X = X_group
+            else:
+                X[positions] = X_group
+
+        if verbose:
+            print("Read %d %s images of size %dx%d from image pyramid (%.2fs)"
+                  % (len(filenames), name, height, width, time.time() - start_time))
+
+        return X
+
+    return read_images
@@ -0,0 +1,376 @@
+"""
+Packed, sharded on-disk format of an image split.
+
+The frames of a folder of images are packed into a few large shard files and
+a manifest (manifest.json) with the shard, byte offset and length, label and
+source filename of every frame. Shards hold either
+
+    raw:  decoded uint8 (channels, height, width) tensors, which are read
+          memory-mapped without any decoding
+    jpeg: the compressed image files as they are, decoded when read
+
+Packing into an existing pack appends the new frames as new shards, existing
+shards are never rewritten. The pack of folder is stored next to it in
+packed_dir(folder).
+
+usage: python -m datasets.shards <folder> [--format raw] [--image_shape 256 256 3] [--label 0]
+"""
+import io
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from functools import partial
+from datasets.decoding import decode_images, load_image, parallel_fill
+
+
+PACK_VERSION = 1
+MANIFEST = "manifest.json"
+
+# folder -> (stamp of the manifest, opened PackedSplit or None if the folder is not packed)
+_packs = {}
+
+
+def packed_dir(folder):
+
+    return os.path.normpath(folder) + ".packed"
+
+
+def read_manifest(pack_dir):
+
+    filename = os.path.join(pack_dir, MANIFEST)
+    if not os.path.exists(filename):
+        return None
+
+    with open(filename) as f:
+        return json.load(f)
+
+
+def _manifest_stamp(pack_dir):
+    """
+    (inode, mtime, size) of the manifest of pack_dir, which change whenever the
+    manifest is rewritten (e.g. by appending to the pack), or None if there is none
+    """
+
+    try:
+        st = os.stat(os.path.join(pack_dir, MANIFEST))
+    except OSError:
+        return None
+
+    return st.st_ino, st.st_mtime, st.st_size
+
+
+def _write_manifest(pack_dir, manifest):
+
+    # written to a temporary file and renamed, so readers never see a partial manifest
+    filename = os.path.join(pack_dir, MANIFEST)
+    with open(filename + ".tmp", 'w') as f:
+        json.dump(manifest, f)
+    os.rename(filename + ".tmp", filename)
+
+
+def pack_split(filenames, pack_dir, labels=None, fmt="raw", image_shape=None, thumbnail=False,
+               frames_per_shard=4096, n_jobs=0):
+    """
+    pack the image files in filenames into shards of frames_per_shard frames
+    in pack_dir. If pack_dir already holds a pack, files whose name is not yet
+    in it are appended as new shards. The manifest is updated after every
+    shard, so an interrupted run leaves a consistent pack.
+
+    labels: label of every file (default 0)
+    fmt: "raw" (decoded uint8 tensors) or "jpeg" (compressed files as they are)
+    image_shape: (height, width, channels) raw frames are decoded to (see
+                 decode_images for thumbnail), not used for jpeg frames
+    """
+
+    assert fmt in ("raw", "jpeg")
+    assert fmt == "jpeg" or image_shape is not None, "raw packs need an image_shape"
+
+    if labels is None:
+        labels = [0] * len(filenames)
+
+    manifest = read_manifest(pack_dir)
+    if manifest is None:
+        if not os.path.exists(pack_dir):
+            os.makedirs(pack_dir)
+        manifest = dict(version=PACK_VERSION, format=fmt, thumbnail=thumbnail, shards=[],
+                        image_shape=list(image_shape) if fmt == "raw" else None,
+                        frames=dict(shard=[], offset=[], length=[], label=[], source=[]))
+    else:
+        assert manifest['format'] == fmt, "pack %s holds %s frames" % (pack_dir, manifest['format'])
+        assert fmt == "jpeg" or tuple(manifest['image_shape']) == tuple(image_shape), \
+            "pack %s holds raw frames of shape %s" % (pack_dir, manifest['image_shape'])
+
+    frames = manifest['frames']
+    known = set(frames['source'])
+    new = [(filename, int(label)) for filename, label in zip(filenames, labels)
+           if os.path.basename(filename) not in known]
+
+    start_time = time.time()
+    n_bytes = 0
+
+    for start in range(0, len(new), frames_per_shard):
+        chunk = new[start:start + frames_per_shard]
+        shard = len(manifest['shards'])
+        shard_name = "shard_%05d.bin" % shard
+        shard_path = os.path.join(pack_dir, shard_name)
+
+        if fmt == "raw":
+            X = decode_images([filename for filename, _ in chunk], image_shape, dtype=np.uint8, n_jobs=n_jobs,
+                              verbose=False, channels_first=True, thumbnail=thumbnail)
+            X.tofile(shard_path + ".tmp")
+            frame_bytes = X[0].nbytes if len(X) else 0
+            offsets = [i * frame_bytes for i in range(len(chunk))]
+            lengths = [frame_bytes] * len(chunk)
+        else:
+            offsets, lengths = [], []
+            offset = 0
+            with open(shard_path + ".tmp", 'wb') as out:
+                for filename, _ in chunk:
+                    with open(filename, 'rb') as f:
+                        data = f.read()
+                    out.write(data)
+                    offsets.append(offset)
+                    lengths.append(len(data))
+                    offset += len(data)
+        os.rename(shard_path + ".tmp", shard_path)
+
+        manifest['shards'].append(shard_name)
+        frames['shard'].extend([shard] * len(chunk))
+        frames['offset'].extend(offsets)
+        frames['length'].extend(lengths)
+        frames['label'].extend(label for _, label in chunk)
+        frames['source'].extend(os.path.basename(filename) for filename, _ in chunk)
+        _write_manifest(pack_dir, manifest)
+
+        n_bytes += sum(lengths)
+
+    print("Packed %d new frames (%.1f MB) into %s in %.2fs, %d frames in total"
+          % (len(new), n_bytes / 2. ** 20, pack_dir, time.time() - start_time, len(frames['source'])))
+
+    return manifest
+
+
+def pack_folder(folder, pack_dir=None, **kwargs):
+    """
+    pack (or append) all files of folder in sorted order, see pack_split
+    """
+
+    filenames = [os.path.join(folder, filename) for filename in sorted(os.listdir(folder))]
+
+    return pack_split(filenames, pack_dir if pack_dir is not None else packed_dir(folder), **kwargs)
+
+
+class PackedSplit(object):
+    """
+    Reader of a pack. Raw shards are memory-mapped, jpeg frames are read from
+    memory-mapped shards and decoded in parallel.
+    """
+
+    def __init__(self, pack_dir):
+
+        manifest = read_manifest(pack_dir)
+        assert manifest is not None, "no pack in %s" % pack_dir
+        assert manifest['version'] == PACK_VERSION
+
+        self.pack_dir = pack_dir
+        self.format = manifest['format']
+        self.thumbnail = manifest['thumbnail']
+        self.image_shape = tuple(manifest['image_shape']) if manifest['image_shape'] else None
+        self.shards = manifest['shards']
+
+        frames = manifest['frames']
+        self.shard = np.array(frames['shard'], dtype=np.int32)
+        self.offset = np.array(frames['offset'], dtype=np.int64)
+        self.length = np.array(frames['length'], dtype=np.int64)
+        self.labels = np.array(frames['label'], dtype=np.int32)
+        self.sources = frames['source']
+        self._index = dict((source, i) for i, source in enumerate(self.sources))
+
+        self._maps = {}
+
+    def __len__(self):
+
+        return len(self.sources)
+
+    def files(self):
+        """
+        paths of the manifest and the shards, e.g. to key caches of this pack
+        """
+
+        return [os.path.join(self.pack_dir, MANIFEST)] + [os.path.join(self.pack_dir, s) for s in self.shards]
+
+    def index(self, sources):
+        """
+        frame indices of the source filenames (paths or names)
+        """
+
+        return np.array([self._index[os.path.basename(source)] for source in sources], dtype=np.int64)
+
+    def select(self, n=None, seed=0):
+        """
+        source names of the frames which select_files would choose from the
+        packed folder: sorted, and a seeded random subset of n if n is smaller
+        """
+
+        sources = sorted(self.sources)
+
+        if n is not None and n < len(sources):
+            rng = np.random.RandomState(seed)
+            idx = np.sort(rng.choice(len(sources), n, replace=False))
+            sources = [sources[i] for i in idx]
+
+        return sources
+
+    def _shard_bytes(self, shard):
+
+        if shard not in self._maps:
+            self._maps[shard] = np.memmap(os.path.join(self.pack_dir, self.shards[shard]), dtype=np.uint8, mode='r')
+
+        return self._maps[shard]
+
+    def frame_bytes(self, i):
+
+        start = self.offset[i]
+        return self._shard_bytes(self.shard[i])[start:start + self.length[i]]
+
+    def read(self, frames, image_shape, dtype=np.float32, n_jobs=0, channels_first=True, thumbnail=None):
+        """
+        read frames (indices) into an array (len(frames), channels, height,
+        width) (or channels last) of the given dtype. Raw frames are copied
+        from the memory-mapped shards in storage order, jpeg frames are decoded
+        like decode_images (thumbnail defaults to the setting of the pack).
+        """
+
+        height, width, channels = image_shape
+        item_shape = (channels, height, width) if channels_first else (height, width, channels)
+        frames = np.asarray(frames, dtype=np.int64)
+
+        if self.format == "raw":
+            if tuple(image_shape) != self.image_shape:
+                raise ValueError("pack %s holds raw frames of shape %s, not %s"
+                                 % (self.pack_dir, self.image_shape, tuple(image_shape)))
+            X = np.empty((len(frames),) + item_shape, dtype=dtype)
+            # sequential reads: visit the frames in the order they are stored
+            order = np.lexsort((self.offset[frames], self.shard[frames]))
+            for j in order:
+                frame = self.frame_bytes(frames[j]).reshape(channels, height, width)
+                X[j] = frame if channels_first else np.moveaxis(frame, 0, -1)
+            return X
+
+        if thumbnail is None:
+            thumbnail = self.thumbnail
+        load = partial(_decode_frame, self, channels_first=channels_first, size=(width, height), thumbnail=thumbnail)
+        X, _ = parallel_fill(list(frames), item_shape, load, dtype=dtype, n_jobs=n_jobs)
+
+        return X
+
+
+def _decode_frame(pack, i, channels_first, size, thumbnail):
+
+    img = load_image(io.BytesIO(pack.frame_bytes(i).tostring()), size, thumbnail)
+    if channels_first:
+        img = np.moveaxis(img, -1, 0)
+
+    return img
+
+
+def open_pack(folder):
+    """
+    the PackedSplit of folder, or None if folder is not packed. the opened pack
+    is reused until its manifest changes (e.g. frames were appended).
+    """
+
+    folder = os.path.normpath(folder)
+    pack_dir = packed_dir(folder)
+    stamp = _manifest_stamp(pack_dir)
+    if folder not in _packs or _packs[folder][0] != stamp:
+        _packs[folder] = (stamp, PackedSplit(pack_dir) if stamp is not None else None)
+
+    return _packs[folder][1]
+
+
+def select_packed_files(folder, n=None, seed=0):
+    """
+    select_files for a packed folder, the returned paths are resolved by read_images
+    """
+
+    return [os.path.join(folder, source) for source in open_pack(folder).select(n, seed)]
+
+
+def pack_key_files(filenames):
+    """
+    the manifests and shards of the packs of filenames, which (with the names)
+    determine the packed images, e.g. to key the dataset cache
+    """
+
+    folders = sorted(set(os.path.dirname(filename) for filename in filenames))
+
+    return sum((open_pack(folder).files() for folder in folders), [])
+
+
+def read_images(filenames, image_shape, dtype=np.float32, n_jobs=0, name="", verbose=True, channels_first=False,
+                thumbnail=None):
+    """
+    decode_images for files of packed folders: every file is read from the
+    pack of its folder. Files of folders without a pack are decoded from disk.
+    """
+
+    start_time = time.time()
+
+    height, width, channels = image_shape
+    item_shape = (channels, height, width) if channels_first else (height, width, channels)
+
+    # group the files by their folder
+    groups = dict()
+    for i, filename in enumerate(filenames):
+        groups.setdefault(os.path.dirname(filename), []).append(i)
+
+    X = None
+    for folder, positions in groups.items():
+        pack = open_pack(folder)
+        group_files = [filenames[i] for i in positions]
+        if pack is not None:
+            X_group = pack.read(pack.index(group_files), image_shape, dtype=dtype, n_jobs=n_jobs,
+                                channels_first=channels_first, thumbnail=thumbnail)
+        else:
+            X_group = decode_images(group_files, image_shape, dtype=dtype, n_jobs=n_jobs, verbose=False,
+                                    channels_first=channels_first, thumbnail=bool(thumbnail))
+        if len(groups) == 1:
+            X = X_group
+        else:
+            if X is None:
+                X = np.empty((len(filenames),) + item_shape, dtype=dtype)
+            X[positions] = X_group
+
+    if X is None:
+        X = np.empty((0,) + item_shape, dtype=dtype)
+
+    elapsed = time.time() - start_time
+    if verbose:
+        print("Read %d packed %s images in %.2fs (%.1f images/sec)"
+              % (len(filenames), name, elapsed, len(filenames) / max(elapsed, 1e-8)))
+
+    return X
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="pack (or append to the pack of) a folder of images")
+    parser.add_argument("folder")
+    parser.add_argument("--pack_dir", default=None, help="default: <folder>.packed")
+    parser.add_argument("--format", choices=["raw", "jpeg"], default="raw")
+    parser.add_argument("--image_shape", type=int, nargs=3, default=None, help="height width channels of raw frames")
+    parser.add_argument("--thumbnail", type=int, default=0,
+                        help="shrink images to fit into the image shape instead of resizing them")
+    parser.add_argument("--label", type=int, default=0, help="label of all frames of the folder")
+    parser.add_argument("--frames_per_shard", type=int, default=4096)
+    parser.add_argument("--n_jobs", type=int, default=0, help="decoding processes (0 uses all cores)")
+
+    args = parser.parse_args()
+    n_files = len(os.listdir(args.folder))
+    pack_folder(args.folder, args.pack_dir, labels=[args.label] * n_files, fmt=args.format,
+                image_shape=args.image_shape, thumbnail=bool(args.thumbnail),
+                frames_per_shard=args.frames_per_shard, n_jobs=args.n_jobs)
@@ -7,8 +7,17 @@ from config import Configuration as Cfg
 from datasets.modules import addConvModule, addConvTransposeModule
 import os
 import numpy as np
+import hashlib
+from functools import partial
 import cPickle as pickle
-from keras.preprocessing.image import load_img, img_to_array
+from datasets.decoding import select_files, decode_images
+from datasets.shards import select_packed_files, read_images, pack_key_files
+from datasets.pyramid import pyramid_reader
+from datasets.video import select_video_frames, decode_video_frames, video_key_files
+from datasets.dedup import unique_images
+from datasets.cache import cache_key
+from datasets.compact import compact_normalization, compact_storage_dtype
+from datasets.streaming import StreamingArray, StreamNormalizer
 
 class SMILE_DataLoader(DataLoader):
 
@@ -40,7 +49,7 @@ class SMILE_DataLoader(DataLoader):
         self.data_path = './data/%s'%self.dataset_name # not being used
 
 
-        self.on_memory = True
+        self.on_memory = not Cfg.stream_data
         Cfg.store_on_gpu = True
 
         # load data from disk
@@ -55,83 +64,196 @@ class SMILE_DataLoader(DataLoader):
 
         print("Loading data...")
 
-        # load normal and outlier data
-        self._X_train = [img_to_array(load_img(Cfg.train_folder + filename)) for filename in os.listdir(Cfg.train_folder)][:Cfg.n_train]
-        self._X_val = [img_to_array(load_img(Cfg.val_folder + filename)) for filename in os.listdir(Cfg.val_folder)][:Cfg.n_val]
+        # choose the files of each split first, then decode only those (from the packed
+        # shards of the folders if Cfg.use_packed_data, or (video, frame) references
+        # decoded from the video files if Cfg.use_video_data)
+        image_shape = (self.image_height, self.image_width, self.channels)
         n_test_out = Cfg.n_test - Cfg.n_test_in
-        _X_test_in = [img_to_array(load_img(Cfg.test_in_folder + filename)) for filename in os.listdir(Cfg.test_in_folder)][:Cfg.n_test_in]
-        _X_test_out = [img_to_array(load_img(Cfg.test_out_folder + filename)) for filename in os.listdir(Cfg.test_out_folder)][:n_test_out]
-        _y_test_in  = np.zeros((Cfg.n_test_in,),dtype=np.int32)
-        _y_test_out = np.ones((n_test_out,),dtype=np.int32)
-        self._X_test = np.concatenate([_X_test_in, _X_test_out])
-        self._y_test = np.concatenate([_y_test_in, _y_test_out])
-        self.out_frac = Cfg.out_frac
+        sources = [Cfg.train_folder, Cfg.val_folder, Cfg.test_in_folder, Cfg.test_out_folder]
+        select = select_packed_files if Cfg.use_packed_data else select_files
+        decode = read_images if Cfg.use_packed_data else decode_images
+        if Cfg.use_video_data:
+            assert not Cfg.use_packed_data, "frames are read from the video files, not from packs"
+            sources = [Cfg.video_train, Cfg.video_val, Cfg.video_test_in, Cfg.video_test_out]
+            select = partial(select_video_frames, stride=Cfg.video_stride)
+            decode = decode_video_frames
+        train_files = select(sources[0], Cfg.n_train, self.seed)
+        val_files = select(sources[1], Cfg.n_val, self.seed)
+        test_in_files = select(sources[2], Cfg.n_test_in, self.seed)
+        test_out_files = select(sources[3], n_test_out, self.seed)
+        if Cfg.use_image_pyramid and not original_scale:
+            # read the level of image_shape from the cached image pyramids of the folders
+            assert not Cfg.use_packed_data, "image pyramids are built from the image folders, not from packs"
+            assert not Cfg.use_video_data, "image pyramids are built from the image folders, not from videos"
+            decode = pyramid_reader(Cfg.pyramid_base_shape, Cfg.pyramid_n_levels, Cfg.data_cache_dir)
+
+        # test-only runs load only the test data (on first access), transformed
+        # with the statistics fitted in training (only the SMILE loader does this)
+        preprocessing_file = "{}/preprocessing.p".format(Cfg.xp_path)
+        if Cfg.only_test and not original_scale:
+            if Cfg.data_storage != "float32":
+                print("Test-only run loads all splits: loading only the test data requires float32 data storage")
+            elif not self.load_preprocessor(preprocessing_file):
+                print("Test-only run loads all splits: no preprocessing statistics in %s" % preprocessing_file)
+            else:
+                key = (self.dataset_name, tuple(test_in_files), tuple(test_out_files), image_shape,
+                       Cfg.use_packed_data, Cfg.use_image_pyramid, os.path.getmtime(preprocessing_file))
+                self.load_test_data(test_in_files, test_out_files, decode, key=key)
+                return
+
+        # read batches from disk instead of holding the data in memory
+        if not self.on_memory and not original_scale:
+            self.load_streaming_data(train_files, val_files, test_in_files, test_out_files)
+            return
+
+        # open preprocessed data from cache if these files were prepared before
+        use_cache = (Cfg.use_data_cache or Cfg.shared_data) and not original_scale
+        if use_cache:
+            file_lists = [train_files, val_files, test_in_files, test_out_files]
+            params = self.preprocessing_params()
+            if Cfg.use_packed_data:
+                # packed files are determined by the manifests and shards of their packs
+                params['packed_files'] = hashlib.sha1(repr(file_lists)).hexdigest()
+                file_lists = [pack_key_files(files) for files in file_lists]
+            if Cfg.use_video_data:
+                # frames are determined by their numbers and their video files
+                params['video_frames'] = hashlib.sha1(repr(file_lists)).hexdigest()
+                file_lists = [video_key_files(frames) for frames in file_lists]
+            self.cache_key = cache_key(file_lists, image_shape=image_shape, **params)
+            if self.load_cached_data(self.cache_key):
+                return
 
-        # tranpose to channels first
-        self._X_train = np.moveaxis(self._X_train,-1,1)
-        self._X_val = np.moveaxis(self._X_val,-1,1)
-        self._X_test = np.moveaxis(self._X_test,-1,1)
+        if Cfg.ad_experiment:
+            # shuffle the file lists to obtain random validation splits, such
+            # that the images are decoded directly in their final order
+            train_files, val_files = self.permute_files(train_files, val_files)
+            print("Shuffled data")
 
+        # decode straight into channels first arrays, compact storage keeps the raw pixels as uint8
+        dtype = np.float32 if original_scale else compact_storage_dtype()
+        self._X_train = decode(train_files, image_shape, dtype=dtype, n_jobs=Cfg.n_decode_workers,
+                               name="train", channels_first=True)
+        self._X_val = decode(val_files, image_shape, dtype=dtype, n_jobs=Cfg.n_decode_workers,
+                             name="val", channels_first=True)
+        self._X_test = decode(test_in_files + test_out_files, image_shape, dtype=dtype,
+                              n_jobs=Cfg.n_decode_workers, name="test", channels_first=True)
+        self._y_test = np.concatenate([np.zeros((len(test_in_files),), dtype=np.int32),
+                                       np.ones((len(test_out_files),), dtype=np.int32)])
+        self.out_frac = Cfg.out_frac
 
-        # cast data properly
-        self._X_train = self._X_train.astype(np.float32)
-        self._X_val = self._X_val.astype(np.float32)
-        self._X_test = self._X_test.astype(np.float32)
-        self._y_test = self._y_test.astype(np.int32)
+        # drop near-identical frames from the train data, compared in the order of the source files
+        # (i.e. consecutive frames of a video) even if the files were shuffled
+        if Cfg.dedup_train_data:
+            order = sorted(range(len(train_files)), key=train_files.__getitem__)
+            keep = unique_images(self._X_train, Cfg.dedup_max_distance, order=order, name="train")
+            if Cfg.ad_experiment:
+                # like permute_files, keep full batches of the (shuffled) frames only
+                assert len(keep) >= Cfg.batch_size
+                keep = keep[:len(keep) // Cfg.batch_size * Cfg.batch_size]
+            if len(keep) < len(self._X_train):
+                self._X_train = self._X_train[keep]
 
         # Train and val labels are 0, since all are normal class
         self._y_train = np.zeros((len(self._X_train),),dtype=np.int32)
         self._y_val = np.zeros((len(self._X_val),),dtype=np.int32)
 
-        if Cfg.ad_experiment:
-            # shuffle to obtain random validation splits
-            np.random.seed(self.seed)
-
-            # shuffle data (since batches are extracted block-wise)
-            self.n_train = len(self._y_train)
-            self.n_val = len(self._y_val)
-            perm_train = np.random.permutation(self.n_train)
-            perm_val = np.random.permutation(self.n_val)
-            self._X_train = self._X_train[perm_train]
-            self._y_train = self._y_train[perm_train]
-            self._X_val = self._X_train[perm_val]
-            self._y_val = self._y_train[perm_val]
-            print("Shuffled data")
+        self.n_train = len(self._y_train)
+        self.n_val = len(self._y_val)
 
-            # Subset train set such that we only get batches of the same size
-            assert(self.n_train >= Cfg.batch_size)
-            self.n_train = (self.n_train / Cfg.batch_size) * Cfg.batch_size
-            subset = np.random.choice(len(self._X_train), self.n_train, replace=False)
-            self._X_train = self._X_train[subset]
-            self._y_train = self._y_train[subset]
+        # Adjust number of batches
+        Cfg.n_batches = int(np.ceil(self.n_train * 1. / Cfg.batch_size))
 
-            # Adjust number of batches
-            Cfg.n_batches = int(np.ceil(self.n_train * 1. / Cfg.batch_size))
+        # keep data compact, normalization is applied to each batch when it is requested
+        if not original_scale and Cfg.data_storage != "float32":
+            assert not (Cfg.zca_whitening or Cfg.pca), "ZCA whitening and PCA require float32 data storage"
+            self._X_train, self._X_val, self._X_test = compact_normalization(
+                self._X_train, self._X_val, self._X_test, storage=Cfg.data_storage, gcn=Cfg.gcn,
+                gcn_scale=Cfg.unit_norm_used)
 
         # normalize data (if original scale should not be preserved)
-        if not original_scale:
+        elif not original_scale:
 
-            # simple rescaling to [0,1]
-            normalize_data(self._X_train, self._X_val, self._X_test, scale=np.float32(255))
+            # rescaling to [0,1], global contrast normalization, ZCA whitening, rescaling to [0,1]
+            # (w.r.t. min and max in train data) and PCA, with statistics fitted on the train data
+            self.preprocess()
 
-            # global contrast normalization
-            if Cfg.gcn:
-                global_contrast_normalization(self._X_train, self._X_val, self._X_test, scale=Cfg.unit_norm_used)
+        if use_cache:
+            self.save_cached_data(self.cache_key)
 
-            # ZCA whitening
-            if Cfg.zca_whitening:
-                self._X_train, self._X_val, self._X_test = zca_whitening(self._X_train, self._X_val, self._X_test)
+        flush_last_line()
+        if isinstance(self._X_train, np.ndarray):
+            print("Max pixel value: ", np.amax(self._X_train))
+        print("Data loaded.")
 
-            # rescale to [0,1] (w.r.t. min and max in train data)
-            rescale_to_unit_interval(self._X_train, self._X_val, self._X_test)
+    def load_test_data(self, test_in_files, test_out_files, decode=decode_images, key=None):
+        """
+        set up only the test set, which is decoded and transformed with the fitted
+        preprocessor when first accessed. data loaders with the same key share the
+        loaded test set. train and val sets are left empty.
+        """
+
+        image_shape = (self.image_height, self.image_width, self.channels)
+        test_files = test_in_files + test_out_files
+
+        def load():
+            self._X_test = decode(test_files, image_shape, n_jobs=Cfg.n_decode_workers, name="test",
+                                  channels_first=True)
+            self._X_test = self.preprocessor.transform(self._X_test)
+            self._y_test = np.concatenate([np.zeros((len(test_in_files),), dtype=np.int32),
+                                           np.ones((len(test_out_files),), dtype=np.int32)])
+            flush_last_line()
+            print("Test data loaded.")
+
+        self.defer_split("test", load, key)
+        self.out_frac = Cfg.out_frac
 
-            # PCA
-            if Cfg.pca:
-                self._X_train, self._X_val, self._X_test = pca(self._X_train, self._X_val, self._X_test, 0.95)
+        # no train and val data is needed to score the test set
+        item_shape = (self.channels, self.image_height, self.image_width)
+        self._X_train = np.empty((0,) + item_shape, dtype=np.float32)
+        self._X_val = np.empty((0,) + item_shape, dtype=np.float32)
+        self._y_train = np.empty((0,), dtype=np.int32)
+        self._y_val = np.empty((0,), dtype=np.int32)
 
-        flush_last_line()
-        print("Max pixel value: ", np.amax(self._X_train))
-        print("Data loaded.")
+        self.n_train = 0
+        self.n_val = 0
+        self.n_test = len(test_files)
+
+    def load_streaming_data(self, train_files, val_files, test_in_files, test_out_files):
+        """
+        set up the splits as StreamingArrays which decode their images from
+        disk when batches are requested. only labels are held in memory.
+        """
+
+        assert not (Cfg.zca_whitening or Cfg.pca), "ZCA whitening and PCA require in-memory data"
+        assert not Cfg.dedup_train_data, "near-duplicate removal requires in-memory data"
+
+        image_shape = (self.image_height, self.image_width, self.channels)
+
+        if Cfg.ad_experiment:
+            train_files, val_files = self.permute_files(train_files, val_files)
+
+        # normalization statistics are fitted in one streamed pass over the train data
+        normalizer = StreamNormalizer(gcn=Cfg.gcn, gcn_scale=Cfg.unit_norm_used)
+        self._X_train = StreamingArray(train_files, image_shape, normalizer)
+        normalizer.fit(self._X_train, buffer_size=Cfg.stream_buffer_size)
+        self._X_val = StreamingArray(val_files, image_shape, normalizer)
+        self._X_test = StreamingArray(test_in_files + test_out_files, image_shape, normalizer)
+
+        # Train and val labels are 0, since all are normal class
+        self._y_train = np.zeros((len(train_files),), dtype=np.int32)
+        self._y_val = np.zeros((len(val_files),), dtype=np.int32)
+        self._y_test = np.concatenate([np.zeros((len(test_in_files),), dtype=np.int32),
+                                       np.ones((len(test_out_files),), dtype=np.int32)])
+        self.out_frac = Cfg.out_frac
+
+        self.n_train = len(self._y_train)
+        self.n_val = len(self._y_val)
+        self.n_test = len(self._y_test)
+
+        # Adjust number of batches
+        Cfg.n_batches = int(np.ceil(self.n_train * 1. / Cfg.batch_size))
+
+        print("Streaming data from disk (buffer of %d samples)." % Cfg.stream_buffer_size)
 
     def print_architecture(self):
         tmp = Cfg.architecture.split("_")
@@ -173,7 +295,8 @@ class SMILE_DataLoader(DataLoader):
                 pad = (ksize-stride+1)//2
                 pad = (pad,pad)
 
-            if Cfg.weight_dict_init & (not nnet.pretrained):
+            # no dictionary is learned if the train data is not loaded (test-only runs load trained weights)
+            if Cfg.weight_dict_init & (not nnet.pretrained) & (self.n_train > 0):
                 # initialize first layer filters by atoms of a dictionary
                 W1_init = learn_dictionary(nnet.data._X_train, n_filters=c1, filter_size=ksize, n_sample=Cfg.n_dict_learn)
                 plot_mosaic(W1_init, title="First layer filters initialization",
@@ -286,7 +409,8 @@ class SMILE_DataLoader(DataLoader):
             # Build architecture
             nnet.addInputLayer(shape=(None, self.channels, self.image_height, self.image_width))
 
-            if Cfg.weight_dict_init & (not nnet.pretrained):
+            # no dictionary is learned if the train data is not loaded (test-only runs load trained weights)
+            if Cfg.weight_dict_init & (not nnet.pretrained) & (self.n_train > 0):
                 # initialize first layer filters by atoms of a dictionary
                 W1_init = learn_dictionary(nnet.data._X_train, n_filters=c_out, filter_size=ksize, n_sample=Cfg.n_dict_learn)
                 plot_mosaic(W1_init, title="First layer filters initialization",
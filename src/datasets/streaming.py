@@ -0,0 +1,189 @@
+import time
+import numpy as np
+
+from datasets.decoding import decode_images
+from datasets.shards import read_images
+from datasets.video import decode_video_frames
+from datasets.preprocessing import gcn
+from config import Configuration as Cfg
+
+
+class StreamingArray(object):
+    """
+    Dataset split which is read from disk instead of being held in memory.
+
+    Indexing (X[idx]) decodes only the requested images and returns them
+    preprocessed as float32 (n, channels, height, width) array, such that
+    code which samples a few images (dictionary initialization, plots) works
+    as with in-memory data. Full passes go through iterate_batches(), which
+    decodes the split block-wise through a bounded shuffle buffer.
+    """
+
+    def __init__(self, filenames, image_shape, normalizer=None):
+
+        self.filenames = list(filenames)
+        self.image_shape = tuple(image_shape)  # (height, width, channels) as decoded
+        self.normalizer = normalizer
+
+    def __len__(self):
+
+        return len(self.filenames)
+
+    @property
+    def shape(self):
+
+        height, width, channels = self.image_shape
+        return (len(self), channels, height, width)
+
+    @property
+    def ndim(self):
+
+        return 4
+
+    @property
+    def size(self):
+
+        return int(np.prod(self.shape))
+
+    @property
+    def dtype(self):
+
+        return np.dtype(np.float32)
+
+    def decode(self, indices, verbose=False):
+        """
+        decode the images at indices to float32 (n, channels, height, width)
+        without preprocessing
+        """
+
+        decode = read_images if Cfg.use_packed_data else decode_images
+        if Cfg.use_video_data:
+            decode = decode_video_frames
+        return decode([self.filenames[i] for i in indices], self.image_shape,
+                      n_jobs=Cfg.n_decode_workers, verbose=verbose, channels_first=True)
+
+    def __getitem__(self, key):
+
+        # only the sample axis may be indexed, further axes are kept whole
+        if isinstance(key, tuple):
+            assert all(k is Ellipsis or (isinstance(k, slice) and k == slice(None)) for k in key[1:]), \
+                "StreamingArray only supports indexing along the sample axis"
+            key = key[0]
+
+        if isinstance(key, (int, np.integer)):
+            return self[[key]][0]
+
+        indices = np.arange(len(self))[key]
+        X = self.decode(indices)
+        if self.normalizer is not None:
+            self.normalizer.transform(X)
+
+        return X
+
+    def iterate_batches(self, targets, batch_size, shuffle=False, buffer_size=1024):
+        """
+        yield (inputs, targets, batch index) for one pass over the split.
+
+        Images are decoded block-wise into a shuffle buffer of buffer_size
+        samples, so memory is bounded by the buffer regardless of the size
+        of the split. If shuffle, the file order is permuted and each buffer
+        is shuffled before batches are drawn from it. The batch index then only
+        counts the batches, it does not locate their samples in the split.
+        """
+
+        n = len(self)
+        buffer_size = max(buffer_size, batch_size)
+
+        order = np.arange(n)
+        if shuffle:
+            np.random.shuffle(order)
+
+        X_rest = None
+        y_rest = None
+        batch_idx = 0
+
+        for start in range(0, n, buffer_size):
+            stop = min(n, start + buffer_size)
+            block = order[start:stop]
+
+            X_buffer = self.decode(block)
+            if self.normalizer is not None:
+                self.normalizer.transform(X_buffer)
+            y_buffer = targets[block]
+
+            if shuffle:
+                perm = np.random.permutation(len(block))
+                X_buffer = X_buffer[perm]
+                y_buffer = y_buffer[perm]
+
+            # samples left over from the previous buffer come first
+            if X_rest is not None:
+                X_buffer = np.concatenate((X_rest, X_buffer))
+                y_buffer = np.concatenate((y_rest, y_buffer))
+                X_rest, y_rest = None, None
+
+            n_full = (len(X_buffer) // batch_size) * batch_size
+            for i in range(0, n_full, batch_size):
+                yield X_buffer[i:i + batch_size], y_buffer[i:i + batch_size], batch_idx
+                batch_idx += 1
+
+            if n_full < len(X_buffer):
+                X_rest = X_buffer[n_full:]
+                y_rest = y_buffer[n_full:]
+
+        if X_rest is not None:
+            yield X_rest, y_rest, batch_idx
+
+
+class StreamNormalizer(object):
+    """
+    Preprocessing applied to each streamed block: scaling by 255, global
+    contrast normalization (if gcn) and rescaling to [0,1] w.r.t. min and max
+    of the train data. min and max are fitted in one pass over the train split.
+    """
+
+    def __init__(self, gcn=False, gcn_scale="std"):
+
+        assert gcn_scale in ("std", "l1", "l2")
+
+        self.gcn = gcn
+        self.gcn_scale = gcn_scale
+        self.X_min = np.float32(0)
+        self.X_max = np.float32(1)
+
+    def _normalize(self, X):
+
+        X /= np.float32(255)
+        if self.gcn:
+            gcn(X, scale=self.gcn_scale)
+
+    def fit(self, X_train, buffer_size=1024):
+
+        print("Fitting normalization statistics on streamed train data...")
+        start_time = time.time()
+
+        X_min, X_max = np.inf, -np.inf
+        n = len(X_train)
+        for start in range(0, n, buffer_size):
+            X = X_train.decode(np.arange(start, min(n, start + buffer_size)))
+            self._normalize(X)
+            X_min = min(X_min, np.min(X))
+            X_max = max(X_max, np.max(X))
+
+        self.X_min = np.float32(X_min)
+        self.X_max = np.float32(X_max)
+
+        print("Fitted normalization statistics (%.2fs)" % (time.time() - start_time))
+
+        return self
+
+    def transform(self, X):
+        """
+        preprocess float32 (n, channels, height, width) images in place
+        """
+
+        self._normalize(X)
+        X -= self.X_min
+        X /= (self.X_max - self.X_min)
+
+        return X
@@ -0,0 +1,253 @@
+from datasets.base import DataLoader
+from datasets.modules import addDenseModule
+from datasets.cache import cache_key, cache_path
+from config import Configuration as Cfg
+import os
+import time
+import shutil
+import numpy as np
+import cPickle as pickle
+from itertools import islice
+
+
+def _is_npy(source):
+
+    return source.endswith(".npy")
+
+
+def source_shape(source, header=False, delimiter=","):
+    """
+    (rows, columns) of a CSV or NPY source of feature vectors (one row per sample)
+    """
+
+    if _is_npy(source):
+        return np.load(source, mmap_mode='r').shape
+
+    with open(source) as f:
+        if header:
+            next(f)
+        n_rows = 0
+        n_columns = None
+        for line in f:
+            if line.strip():
+                if n_columns is None:
+                    n_columns = len(line.split(delimiter))
+                n_rows += 1
+
+    return n_rows, n_columns
+
+
+def read_source(source, header=False, delimiter=",", chunk_rows=65536):
+    """
+    yield the rows of a CSV or NPY source as float32 chunks of up to chunk_rows rows
+    """
+
+    if _is_npy(source):
+        X = np.load(source, mmap_mode='r')
+        for start in range(0, len(X), chunk_rows):
+            yield np.asarray(X[start:start + chunk_rows], dtype=np.float32)
+        return
+
+    with open(source) as f:
+        if header:
+            next(f)
+        while True:
+            lines = list(islice(f, chunk_rows))
+            if not lines:
+                break
+            X = np.loadtxt(lines, dtype=np.float32, delimiter=delimiter, ndmin=2)
+            if len(X):
+                yield X
+
+
+def convert_sources(cache_dir, key, splits, header=False, delimiter=",", standardize=True, chunk_rows=65536):
+    """
+    write the sources of every split into a float32 matrix of cache entry key in
+    the layout of the dataset cache (see cache.save_cached), such that the splits
+    can be opened memory-mapped by DataLoader.load_cached_data. the sources are
+    read chunk-wise, so they do not have to fit into memory.
+
+    splits: dict which_set -> (normal sources, anomalous sources)
+    standardize: scale all splits to zero mean and unit variance of the train features
+    """
+
+    start_time = time.time()
+    print("Converting tabular data to %s..." % cache_path(cache_dir, key))
+
+    path = cache_path(cache_dir, key)
+    tmp_path = "%s.tmp%d" % (path, os.getpid())
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    shapes = dict((source, source_shape(source, header, delimiter))
+                  for sources in splits.values() for source in sum(sources, []))
+    n_features = set(n_columns for _, n_columns in shapes.values())
+    assert len(n_features) == 1, "all tabular sources need the same number of columns"
+    n_features = n_features.pop()
+
+    X = dict()
+    sum_train = np.zeros(n_features, dtype=np.float64)
+    sq_sum_train = np.zeros(n_features, dtype=np.float64)
+    for which_set, (normal, anomalous) in splits.items():
+        n_normal = sum(shapes[source][0] for source in normal)
+        n = n_normal + sum(shapes[source][0] for source in anomalous)
+
+        X[which_set] = np.lib.format.open_memmap(os.path.join(tmp_path, "_X_%s.npy" % which_set), mode='w+',
+                                                 dtype=np.float32, shape=(n, n_features))
+        row = 0
+        for source in normal + anomalous:
+            for X_chunk in read_source(source, header, delimiter, chunk_rows):
+                X[which_set][row:row + len(X_chunk)] = X_chunk
+                row += len(X_chunk)
+                if which_set == "train":
+                    sum_train += X_chunk.sum(axis=0, dtype=np.float64)
+                    sq_sum_train += np.square(X_chunk, dtype=np.float64).sum(axis=0)
+        assert row == n
+
+        # anomalies are labeled 1, all other samples 0
+        y = np.zeros(n, dtype=np.int32)
+        y[n_normal:] = 1
+        np.save(os.path.join(tmp_path, "_y_%s.npy" % which_set), y)
+
+    meta = {'out_frac': Cfg.out_frac, 'n_features': n_features}
+    if standardize:
+        n_train = max(len(X["train"]), 1)
+        mean = (sum_train / n_train).astype(np.float32)
+        std = np.sqrt(np.maximum(sq_sum_train / n_train - np.square(sum_train / n_train), 0)).astype(np.float32)
+        std[std == 0] = 1
+        for X_split in X.values():
+            for start in range(0, len(X_split), chunk_rows):
+                X_chunk = X_split[start:start + chunk_rows]
+                X_chunk -= mean
+                X_chunk /= std
+        meta['mean'] = mean
+        meta['std'] = std
+
+    for X_split in X.values():
+        X_split.flush()
+    del X
+
+    # meta file marks the entry as complete
+    with open(os.path.join(tmp_path, "meta.p"), 'wb') as f:
+        pickle.dump(meta, f)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process converted the same sources in the meantime
+        shutil.rmtree(tmp_path)
+
+    print("Converted tabular data (%.2fs)" % (time.time() - start_time))
+
+
+class TABULAR_DataLoader(DataLoader):
+    """
+    Feature vectors (e.g. of sensors) from CSV or NPY sources, converted once
+    into float32 matrices of the dataset cache which are opened memory-mapped,
+    so batches are zero-copy slices of the files.
+    """
+
+    def __init__(self):
+
+        DataLoader.__init__(self)
+
+        self.dataset_name = "tabular"
+
+        self.seed = Cfg.seed
+
+        self.n_classes = 2
+
+        self.data_path = Cfg.data_cache_dir
+
+        self.on_memory = True
+        Cfg.store_on_gpu = True
+
+        # load data from disk
+        self.load_data()
+
+    def check_specific(self):
+
+        # store primal variables on RAM
+        assert Cfg.store_on_gpu
+
+    def load_data(self):
+
+        print("Loading data...")
+
+        splits = {'train': (list(Cfg.tabular_train), []),
+                  'val': (list(Cfg.tabular_val), []),
+                  'test': (list(Cfg.tabular_test_in), list(Cfg.tabular_test_out))}
+        assert splits['train'][0], "Cfg.tabular_train lists no sources"
+
+        sources = [sum(splits[which_set], []) for which_set in ("train", "val", "test")]
+        self.cache_key = cache_key(sources, tabular=True, n_test_in=len(Cfg.tabular_test_in),
+                                   header=Cfg.tabular_csv_header, delimiter=Cfg.tabular_delimiter,
+                                   standardize=Cfg.tabular_standardize)
+
+        if not self.load_cached_data(self.cache_key):
+            convert_sources(self.data_cache_dir(), self.cache_key, splits, header=Cfg.tabular_csv_header,
+                            delimiter=Cfg.tabular_delimiter, standardize=Cfg.tabular_standardize)
+            assert self.load_cached_data(self.cache_key)
+            self.release_cache_lock()
+
+        self.n_features = self._X_train.shape[1]
+
+        print("Data loaded: %d/%d/%d samples of %d features."
+              % (self.n_train, self.n_val, self.n_test, self.n_features))
+
+    def build_architecture(self, nnet):
+
+        # architecture spec U1_U2_..._Z: units of the dense layers, Z is the representation dimension
+        units = [int(n_units) for n_units in str(Cfg.tabular_architecture).split("_")]
+
+        nnet.addInputLayer(shape=(None, self.n_features))
+
+        for n_units in units[:-1]:
+            addDenseModule(nnet, num_units=n_units, bias=Cfg.tabular_bias, use_batch_norm=Cfg.use_batch_norm,
+                           dropout=Cfg.dropout, p_dropout=0.2)
+            if Cfg.debug_architecture_layers: print("Added dense layer %d" % nnet.n_dense_layers)
+
+        # Code Layer
+        if Cfg.dropout:
+            nnet.addDropoutLayer()
+        if Cfg.tabular_bias:
+            nnet.addDenseLayer(num_units=units[-1])
+        else:
+            nnet.addDenseLayer(num_units=units[-1], b=None)
+
+        # Add ouput/feature layer
+        if Cfg.softmax_loss:
+            nnet.addDenseLayer(num_units=1)
+            nnet.addSigmoidLayer()
+        elif Cfg.svdd_loss:
+            nnet.setFeatureLayer()  # set the currently highest layer to be the SVDD feature layer
+        else:
+            raise ValueError("No valid choice of loss for dataset " + self.dataset_name)
+
+    def build_autoencoder(self, nnet):
+
+        # encoder of build_architecture and the mirrored decoder
+        units = [int(n_units) for n_units in str(Cfg.tabular_architecture).split("_")]
+
+        nnet.addInputLayer(shape=(None, self.n_features))
+
+        for n_units in units[:-1]:
+            addDenseModule(nnet, num_units=n_units, bias=Cfg.tabular_bias, use_batch_norm=Cfg.use_batch_norm,
+                           dropout=Cfg.dropout, p_dropout=0.2)
+
+        # Code Layer
+        if Cfg.tabular_bias:
+            nnet.addDenseLayer(num_units=units[-1])
+        else:
+            nnet.addDenseLayer(num_units=units[-1], b=None)
+        nnet.setFeatureLayer()  # set the currently highest layer to be the SVDD feature layer
+        if Cfg.debug_architecture_layers: print("Feature layer here")
+
+        for n_units in reversed(units[:-1]):
+            addDenseModule(nnet, num_units=n_units, bias=Cfg.tabular_bias, use_batch_norm=Cfg.use_batch_norm,
+                           dropout=Cfg.dropout, p_dropout=0.2)
+
+        # reconstruction layer, linear since standardized features are unbounded
+        nnet.addDenseLayer(num_units=self.n_features)
+        if Cfg.debug_architecture_layers: print("Added reconstruction layer")
@@ -0,0 +1,167 @@
+import cv2
+import time
+import numpy as np
+
+from datasets.decoding import parallel_write, thumbnail_size
+
+
+def video_frame_count(video, tail=64):
+    """
+    number of frames of video which actually decode. CAP_PROP_FRAME_COUNT is
+    only an estimate for many containers, so the frames from tail frames before
+    the estimated end are grabbed until one fails (going further back if the
+    estimate lies beyond the end).
+    """
+
+    capture = cv2.VideoCapture(video)
+    if not capture.isOpened():
+        raise IOError("cannot open video %s" % video)
+
+    try:
+        estimate = max(int(capture.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        step = tail
+        while True:
+            position = max(estimate - step, 0)
+            capture.set(cv2.CAP_PROP_POS_FRAMES, position)
+            if capture.grab():
+                position += 1
+                break
+            if position == 0:
+                # not a single frame decodes
+                return 0
+            step *= 2
+
+        while capture.grab():
+            position += 1
+    finally:
+        capture.release()
+
+    return position
+
+
+def video_frames(ranges, stride=1):
+    """
+    (video, frame) references of every stride-th frame of the video ranges.
+    a range is a video file or a tuple (video file, first frame, stop frame),
+    where a stop frame of None is the end of the video.
+    """
+
+    frames = []
+    for video_range in ranges:
+        if isinstance(video_range, basestring):
+            video_range = (video_range, 0, None)
+        video, start, stop = video_range
+        # only frames which actually decode, the stop of a range may lie beyond the end
+        n_frames = video_frame_count(video)
+        stop = n_frames if stop is None else min(stop, n_frames)
+        frames.extend((video, frame) for frame in range(start, stop, stride))
+
+    return frames
+
+
+def select_video_frames(ranges, n=None, seed=0, stride=1):
+    """
+    select_files for frames of videos: the frames of ranges (see video_frames)
+    and, if n is smaller than their number, a seeded random subset of n frames
+    in the same order. only the returned frames need to be decoded.
+    """
+
+    frames = video_frames(ranges, stride)
+
+    if n is not None and n < len(frames):
+        rng = np.random.RandomState(seed)
+        idx = np.sort(rng.choice(len(frames), n, replace=False))
+        frames = [frames[i] for i in idx]
+
+    return frames
+
+
+def video_key_files(frames):
+    """
+    the video files of frames, which (with the frame numbers) determine the
+    decoded frames, e.g. to key the dataset cache
+    """
+
+    return sorted(set(video for video, _ in frames))
+
+
+def read_video_segment(video, frames, size=None, thumbnail=False, seek_gap=250):
+    """
+    decode the frames (ascending frame numbers) of video to float32 RGB arrays
+    (height, width, channels), resized like load_image. frames are read
+    sequentially, skipping by grabbing (which does not convert frames) and only
+    seeking over gaps larger than seek_gap frames.
+    """
+
+    capture = cv2.VideoCapture(video)
+    if not capture.isOpened():
+        raise IOError("cannot open video %s" % video)
+
+    position = 0
+    try:
+        for frame in frames:
+            if frame < position or frame - position > seek_gap:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, frame)
+                position = frame
+            while position < frame:
+                capture.grab()
+                position += 1
+
+            ok, img = capture.read()
+            position += 1
+            if not ok:
+                raise IOError("cannot read frame %d of video %s" % (frame, video))
+
+            if size is not None:
+                target = thumbnail_size((img.shape[1], img.shape[0]), size) if thumbnail else tuple(size)
+                if target != (img.shape[1], img.shape[0]):
+                    img = cv2.resize(img, target, interpolation=cv2.INTER_AREA)
+
+            yield np.asarray(img[..., ::-1], dtype=np.float32)
+    finally:
+        capture.release()
+
+
+def decode_video_frames(frames, image_shape, dtype=np.float32, n_jobs=0, segment_size=256, name="", verbose=True,
+                        channels_first=False, thumbnail=False):
+    """
+    decode_images for (video, frame) references: the frames of every video are
+    decoded in segments of up to segment_size frames of one file, in parallel
+    worker processes which write straight into their slots of the output array,
+    so X[i] always corresponds to frames[i].
+    """
+
+    start_time = time.time()
+
+    height, width, channels = image_shape
+    item_shape = (channels, height, width) if channels_first else (height, width, channels)
+    n = len(frames)
+
+    def load(video, segment_frames):
+        for img in read_video_segment(video, segment_frames, size=(width, height), thumbnail=thumbnail):
+            yield np.moveaxis(img, -1, 0) if channels_first else img
+
+    # segments of frames of the same video in ascending order
+    groups = dict()
+    for i, (video, frame) in enumerate(frames):
+        groups.setdefault(video, []).append((frame, i))
+    segments = []
+    for video in sorted(groups):
+        group = sorted(groups[video])
+        for start in range(0, len(group), segment_size):
+            segment = group[start:start + segment_size]
+            segments.append((video, [i for _, i in segment], [frame for frame, _ in segment]))
+
+    def decode_segment(X, segment):
+        video, positions, segment_frames = segment
+        for i, img in zip(positions, load(video, segment_frames)):
+            X[i] = img
+
+    X, n_jobs = parallel_write(segments, (n,) + item_shape, decode_segment, dtype=dtype, n_jobs=n_jobs)
+
+    elapsed = time.time() - start_time
+    if verbose:
+        print("Decoded %d %s frames of %d videos in %.2fs (%.1f frames/sec, %d workers)"
+              % (n, name, len(groups), elapsed, n / max(elapsed, 1e-8), n_jobs))
+
+    return X
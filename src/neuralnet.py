@@ -104,6 +104,10 @@ class NeuralNet:
 
         self.data = data_loader()
 
+        # seed the global RNG once the data is loaded, such that weight initialization and batch
+        # order do not depend on whether the data was decoded or loaded from the dataset cache
+        np.random.seed(self.data.seed)
+
         if pretrain:
             self.data.build_autoencoder(self)
 
@@ -262,6 +266,8 @@ class NeuralNet:
         self.ad_log['train_accuracy'] = self.diag['train']['acc'][-1]
         if not Cfg.only_test:
             self.ad_log['train_time'] = self.train_time
+            self.ad_log['n_train'] = self.data.n_train
+            self.ad_log['n_epochs'] = self.n_epochs
 
         self.ad_log['val_auc'] = self.diag['val']['auc'][-1]
         self.ad_log['val_aupr'] = self.diag['val']['aupr'][-1]
@@ -541,6 +547,9 @@ class NeuralNet:
         print("Loading weights from %s" % filename)
         load_weights(self, filename)
 
+        if os.path.basename(filename) == "ae_pretrained_weights.p":
+            self.pretrained = True  # the network starts from the weights of the pretrained autoencoder
+
     def update_R(self):
         """
         method to update R while leaving the network parameters and center c fixed in a block coordinate optimization
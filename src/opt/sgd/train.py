@@ -1,7 +1,10 @@
+import os
 import time
 import numpy as np
+import cPickle as pickle
 
 from config import Configuration as Cfg
+from datasets.coreset import select_coreset
 from utils.monitoring import performance, ae_performance
 from utils.visualization.diagnostics_plot import plot_diagnostics
 
@@ -18,6 +21,10 @@ def train_network(nnet):
     print("Hard margin: %r\nCenter fixed: %r\nBlock coordinate: %r"%(Cfg.hard_margin, Cfg.center_fixed, Cfg.block_coordinate))
     epoch = nnet.checkpoint_epoch
 
+    # train on a coreset of the train data only
+    if Cfg.coreset_size > 0 and Cfg.coreset_size < nnet.data.n_train:
+        select_train_coreset(nnet, Cfg.coreset_size)
+
     # save initial network parameters for diagnostics
     nnet.save_initial_parameters()
     if Cfg.nnet_diagnostics & Cfg.e1_diagnostics:
@@ -42,6 +49,7 @@ def train_network(nnet):
 
         # In each epoch, we do a full pass over the training data:
         start_time = time.time()
+        nnet.data.wait_stats.reset()
 
         # learning rate decay
         if Cfg.lr_decay:
@@ -133,7 +141,8 @@ def train_network(nnet):
             nnet.log['test_accuracy'].append(test_accuracy)
             nnet.log['time_stamp'].append(time.time() - nnet.clock)
 
-        print("Epoch {} of {} took {:.3f}s".format(epoch + 1, nnet.n_epochs, time.time() - start_time))
+        print("Epoch {} of {} took {:.3f}s, {}".format(epoch + 1, nnet.n_epochs, time.time() - start_time,
+                                                      nnet.data.wait_stats))
         print('')
 
         # # save model as required
@@ -180,6 +189,7 @@ def train_network(nnet):
 
     # save final weights (and best weights in case of two-class dataset)
     nnet.dump_weights("{}/weights_final.p".format(Cfg.xp_path))
+    nnet.data.save_preprocessor("{}/preprocessing.p".format(Cfg.xp_path))
     if nnet.data.n_classes == 2:
         nnet.dump_best_weights("{}/weights_best_ep.p".format(Cfg.xp_path))
 
@@ -268,6 +278,54 @@ def initialize_c_as_mean(nnet, n_batches, eps=0.1):
     print("c initialized.")
 
 
+def select_train_coreset(nnet, k):
+    """
+    restrict the train data to k samples chosen by greedy k-center selection on
+    the final layer representations of the network, i.e. of the encoder of the
+    pretrained autoencoder. the selection is stored in the experiment directory
+    and reused when training is resumed from a checkpoint on the same data.
+    """
+
+    assert nnet.data.on_memory, "coreset selection requires in-memory data"
+    assert Cfg.svdd_loss, "coreset selection requires the Deep SVDD feature representations"
+
+    # the stored selection only applies to the same train data, seed and size
+    key = dict(dataset=nnet.data.dataset_name, n_train=nnet.data.n_train, k=k, seed=Cfg.seed,
+               data_key=getattr(nnet.data, 'cache_key', None))
+
+    filename = "{}/coreset.p".format(Cfg.xp_path)
+    idx = None
+    if os.path.exists(filename):
+        with open(filename, 'rb') as f:
+            coreset = pickle.load(f)
+        if isinstance(coreset, dict) and coreset.get('key') == key:
+            idx = coreset['idx']
+            print("Loaded coreset of %d train samples from %s" % (k, filename))
+        else:
+            print("Ignoring coreset of other train data in %s" % filename)
+
+    if idx is None:
+        assert nnet.pretrained, "coreset selection requires the weights of the pretrained autoencoder"
+
+        print("Embedding train data for coreset selection...")
+
+        reps = np.empty((nnet.data.n_train, nnet.feature_layer.output_shape[1]), dtype=Cfg.floatX)
+        for batch in nnet.data.get_epoch('train'):
+            inputs, targets, batch_idx = batch
+            start_idx = batch_idx * Cfg.batch_size
+            stop_idx = min(nnet.data.n_train, start_idx + Cfg.batch_size)
+
+            _, _, _, _, _, b_rep, _, _, _, _ = nnet.forward(inputs, targets)
+            reps[start_idx:stop_idx, :] = b_rep
+
+        idx = select_coreset(reps, k, seed=Cfg.seed, name="train")
+
+        with open(filename, 'wb') as f:
+            pickle.dump({'key': key, 'idx': idx}, f)
+
+    nnet.data.select_train(idx)
+
+
 def train_autoencoder(nnet):
 
     print("Training autoencoder with %s solver" % nnet.sgd_solver)
@@ -284,6 +342,7 @@ def train_autoencoder(nnet):
     while epoch < nnet.ae_n_epochs:
 
         start_time = time.time()
+        nnet.data.wait_stats.reset()
 
         if Cfg.ae_lr_drop and (epoch == Cfg.ae_lr_drop_in_epoch):
             # Drop the learning rate in epoch specified in Cfg.ae_lr_drop_after_epoch by factor Cfg.ae_lr_drop_factor
@@ -316,7 +375,11 @@ def train_autoencoder(nnet):
 
         # save train diagnostics and test performance on val and test data if specified
         if Cfg.ae_diagnostics:
-            nnet.save_ae_diagnostics('train', epoch, train_err, train_scores, l2)
+            if Cfg.shuffle_samples or not nnet.data.on_memory:
+                # batches of shuffled (or streamed) samples do not map to sample positions, evaluate in order
+                _, _ = ae_performance(nnet, which_set='train', epoch=epoch)
+            else:
+                nnet.save_ae_diagnostics('train', epoch, train_err, train_scores, l2)
 
             # Performance on validation and test set
             if nnet.data.n_val > 0:
@@ -329,7 +392,8 @@ def train_autoencoder(nnet):
             if nnet.data.n_val > 0:
                 print("{:32} {:.5f}".format("Val error:", val_err))
             print("{:32} {:.5f}".format("Test error:", test_err))
-        print("Epoch {} of {} took {:.3f}s".format(epoch + 1, nnet.ae_n_epochs, time.time() - start_time))
+        print("Epoch {} of {} took {:.3f}s, {}".format(epoch + 1, nnet.ae_n_epochs, time.time() - start_time,
+                                                      nnet.data.wait_stats))
         print("")
 
         epoch += 1
@@ -357,6 +421,7 @@ def train_autoencoder(nnet):
         nnet.dump_weights("{}/ae_pretrained_weights.p".format(Cfg.xp_path), pretrain=True)
     else:
         nnet.dump_weights("{}/weights_final.p".format(Cfg.xp_path))
+    nnet.data.save_preprocessor("{}/preprocessing.p".format(Cfg.xp_path))
 
     # if image data plot some random reconstructions
     if nnet.data._X_train.ndim == 4:
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+
+from datasets.coreset import k_center_greedy
+
+
+def naive_k_center(X, k, first):
+
+    idx = [first]
+    dist = np.sum((X - X[first]) ** 2, axis=1)
+    for _ in range(k - 1):
+        idx.append(int(np.argmax(dist)))
+        dist = np.minimum(dist, np.sum((X - X[idx[-1]]) ** 2, axis=1))
+
+    return np.sort(idx), np.sqrt(dist.max())
+
+
+class KCenterGreedyTest(unittest.TestCase):
+
+    def test_matches_naive_selection(self):
+
+        X = np.random.RandomState(0).randn(300, 5).astype(np.float32)
+        first = np.random.RandomState(1).randint(len(X))
+
+        idx, radius = k_center_greedy(X, 20, chunk_size=64, seed=1)
+        naive_idx, naive_radius = naive_k_center(X.astype(np.float64), 20, first)
+
+        np.testing.assert_array_equal(idx, naive_idx)
+        self.assertAlmostEqual(radius, naive_radius, places=4)
+
+    def test_one_center_per_cluster(self):
+
+        rng = np.random.RandomState(0)
+        centers = np.array([[0, 0], [100, 0], [0, 100]], dtype=np.float32)
+        X = np.repeat(centers, 50, axis=0) + rng.rand(150, 2).astype(np.float32)
+
+        idx, radius = k_center_greedy(X, 3)
+
+        self.assertEqual(sorted(idx // 50), [0, 1, 2])
+        self.assertLess(radius, 2)
+
+    def test_all_samples_cover_with_zero_radius(self):
+
+        X = np.random.RandomState(0).randn(10, 3).astype(np.float32)
+
+        idx, radius = k_center_greedy(X, 10)
+
+        np.testing.assert_array_equal(idx, np.arange(10))
+        self.assertAlmostEqual(radius, 0, places=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
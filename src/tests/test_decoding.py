@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+from PIL import Image
+
+from datasets.decoding import parallel_fill, thumbnail_size
+
+
+class ThumbnailSizeTest(unittest.TestCase):
+
+    def test_known_sizes(self):
+
+        self.assertEqual(thumbnail_size((1280, 720), (64, 64)), (64, 36))
+        self.assertEqual(thumbnail_size((720, 1280), (64, 64)), (36, 64))
+        self.assertEqual(thumbnail_size((32, 16), (64, 64)), (32, 16))
+        self.assertEqual(thumbnail_size((1000, 1), (10, 10)), (10, 1))
+
+    def test_matches_pil_thumbnail(self):
+
+        for width in range(1, 300, 7):
+            for height in range(1, 300, 11):
+                for size in [(64, 48), (100, 100), (37, 91)]:
+                    img = Image.new("RGB", (width, height))
+                    img.thumbnail(size)
+                    self.assertEqual(thumbnail_size((width, height), size), img.size)
+
+
+class ParallelFillTest(unittest.TestCase):
+
+    def test_items_in_order(self):
+
+        for n_jobs in (1, 3):
+            X, _ = parallel_fill(list(range(50)), (2,), lambda i: (i, -i), dtype=np.float32, n_jobs=n_jobs,
+                                 chunk_size=4)
+
+            np.testing.assert_array_equal(X[:, 0], np.arange(50))
+            np.testing.assert_array_equal(X[:, 1], -np.arange(50))
+
+
+if __name__ == '__main__':
+    unittest.main()
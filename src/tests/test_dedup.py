@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+
+from datasets.dedup import average_hash, near_duplicates, unique_images
+
+
+def drifting_hashes(n_drift, n_static):
+    """
+    packed 64 bit hashes which drift by one more set bit per frame, followed by
+    n_static copies of the last drifted hash
+    """
+
+    bits = np.zeros((n_drift + n_static, 64), dtype=bool)
+    for i in range(n_drift + n_static):
+        bits[i, :min(i, n_drift - 1) + 1] = True
+
+    return np.packbits(bits, axis=1)
+
+
+class NearDuplicatesTest(unittest.TestCase):
+
+    def test_static_scene_collapses(self):
+
+        hashes = np.repeat(drifting_hashes(1, 0), 10, axis=0)
+
+        np.testing.assert_array_equal(near_duplicates(hashes, 4), [False] + [True] * 9)
+
+    def test_drift_is_compared_to_last_kept_frame(self):
+
+        hashes = drifting_hashes(5, 7)
+
+        # a frame is kept whenever it moved more than 1 bit from the last kept frame,
+        # the identical frames at the end are dropped
+        np.testing.assert_array_equal(near_duplicates(hashes, 1).astype(int),
+                                      [0, 1, 0, 1, 0, 1, 1, 1, 1, 1, 1, 1])
+
+    def test_distinct_frames_are_kept(self):
+
+        hashes = np.random.RandomState(0).randint(0, 256, (100, 8)).astype(np.uint8)
+
+        self.assertFalse(near_duplicates(hashes, 4).any())
+
+    def test_negative_distance_keeps_all(self):
+
+        hashes = np.repeat(drifting_hashes(1, 0), 3, axis=0)
+
+        self.assertFalse(near_duplicates(hashes, -1).any())
+
+
+class UniqueImagesTest(unittest.TestCase):
+
+    def test_permuted_images_are_compared_in_frame_order(self):
+
+        rng = np.random.RandomState(0)
+        scenes = rng.rand(20, 3, 16, 16).astype(np.float32)
+        X = np.repeat(scenes, 5, axis=0)
+        perm = rng.permutation(len(X))
+
+        keep = unique_images(X[perm], 0, order=np.argsort(perm))
+
+        # one frame of every scene, in the (permuted) order of X
+        self.assertEqual(len(keep), 20)
+        self.assertEqual(sorted(perm[keep] // 5), list(range(20)))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_average_hash_ignores_brightness(self):
+
+        X = np.random.RandomState(0).rand(1, 3, 32, 32).astype(np.float32)
+
+        np.testing.assert_array_equal(average_hash(X), average_hash(X * 0.5 + 0.2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+
+from datasets.iterator import iterate_batches, gather_batches
+
+
+def data(n=23, dim=3):
+
+    X = np.arange(n * dim, dtype=np.float32).reshape(n, dim)
+    y = np.arange(n, dtype=np.int32)
+
+    return X, y
+
+
+class IterateBatchesTest(unittest.TestCase):
+
+    def test_batches_are_views_in_order(self):
+
+        X, y = data()
+
+        batches = list(iterate_batches(X, y, 5))
+
+        self.assertEqual([batch_idx for _, _, batch_idx in batches], list(range(5)))
+        for inputs, targets, batch_idx in batches:
+            np.testing.assert_array_equal(inputs, X[batch_idx * 5:(batch_idx + 1) * 5])
+            np.testing.assert_array_equal(targets, y[batch_idx * 5:(batch_idx + 1) * 5])
+            self.assertTrue(np.may_share_memory(inputs, X))
+        self.assertEqual(len(batches[-1][0]), 3)
+
+    def test_shuffle_permutes_batch_order_only(self):
+
+        X, y = data()
+        np.random.seed(0)
+
+        batches = list(iterate_batches(X, y, 5, shuffle=True))
+
+        self.assertEqual(sorted(batch_idx for _, _, batch_idx in batches), list(range(5)))
+        for inputs, targets, batch_idx in batches:
+            np.testing.assert_array_equal(targets, y[batch_idx * 5:(batch_idx + 1) * 5])
+
+
+class GatherBatchesTest(unittest.TestCase):
+
+    def test_every_sample_once(self):
+
+        X, y = data()
+        np.random.seed(0)
+
+        batches = [(inputs.copy(), targets.copy()) for inputs, targets, _ in
+                   iterate_batches(X, y, 5, shuffle=True, shuffle_samples=True)]
+
+        targets = np.concatenate([targets for _, targets in batches])
+        self.assertEqual(sorted(targets), list(y))
+        self.assertFalse(np.array_equal(targets, y))
+        for inputs, targets in batches:
+            np.testing.assert_array_equal(inputs, X[targets])
+
+    def test_buffers_are_reused(self):
+
+        X, y = data()
+
+        batches = list(gather_batches(X, y, 5, n_buffers=2))
+
+        self.assertFalse(np.may_share_memory(batches[0][0], batches[1][0]))
+        self.assertTrue(np.may_share_memory(batches[0][0], batches[2][0]))
+        self.assertFalse(np.may_share_memory(batches[0][0], X))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from datasets.loadbdd100k import LabelIndex
+
+
+def label(name, weather, scene, timeofday):
+
+    return {"name": name, "attributes": {"weather": weather, "scene": scene, "timeofday": timeofday}}
+
+
+LABELS = [label("a.jpg", "clear", "highway", "daytime"),
+          label("b.jpg", "rainy", "highway", "night"),
+          label("c.jpg", "clear", "city street", "night"),
+          label("d.jpg", "overcast", "highway", "daytime"),
+          label("e.jpg", "clear", "highway", "daytime")]
+
+
+def naive_match(labels, attributes_to_choose):
+
+    names = []
+    for entry in labels:
+        if all(entry["attributes"][attribute] in (options if isinstance(options, list) else [options])
+               for attribute, options in attributes_to_choose):
+            names.append(entry["name"])
+
+    return names
+
+
+class LabelIndexTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.index = LabelIndex.from_json(LABELS)
+
+    def check(self, spec):
+
+        self.assertEqual(self.index.matching_files(spec), naive_match(LABELS, spec))
+
+    def test_single_attribute(self):
+
+        self.check([("weather", "clear")])
+
+    def test_options_and_attributes(self):
+
+        self.check([("weather", ["clear", "overcast"]), ("scene", "highway"), ("timeofday", "daytime")])
+
+    def test_repeated_options_match_once(self):
+
+        self.assertEqual(self.index.matching_files([("weather", ["clear", "clear"])]), ["a.jpg", "c.jpg", "e.jpg"])
+
+    def test_unknown_value_matches_nothing(self):
+
+        self.assertEqual(self.index.matching_files([("weather", "snowy")]), [])
+
+    def test_empty_spec_matches_all(self):
+
+        self.check([])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+
+from datasets.pyramid import area_downsample, level_shapes
+
+
+class AreaDownsampleTest(unittest.TestCase):
+
+    def test_averages_blocks(self):
+
+        X = np.arange(2 * 3 * 4 * 6, dtype=np.float32).reshape(2, 3, 4, 6)
+
+        Y = area_downsample(X, chunk_size=1)
+
+        self.assertEqual(Y.shape, (2, 3, 2, 3))
+        np.testing.assert_allclose(Y, X.reshape(2, 3, 2, 2, 3, 2).mean(axis=(3, 5)))
+
+    def test_odd_sizes_drop_last_row_and_column(self):
+
+        X = np.random.RandomState(0).rand(1, 1, 5, 7).astype(np.float32)
+
+        Y = area_downsample(X)
+
+        self.assertEqual(Y.shape, (1, 1, 2, 3))
+        np.testing.assert_allclose(Y, X[:, :, :4, :6].reshape(1, 1, 2, 2, 3, 2).mean(axis=(3, 5)), rtol=1e-6)
+
+    def test_integer_images_are_rounded(self):
+
+        X = np.array([[[[0, 1], [1, 1]], [[0, 0], [0, 1]]]], dtype=np.uint8)
+
+        Y = area_downsample(X)
+
+        self.assertEqual(Y.dtype, np.uint8)
+        np.testing.assert_array_equal(Y.ravel(), [1, 0])
+
+    def test_level_shapes(self):
+
+        self.assertEqual(level_shapes((256, 192, 3), 3), [(256, 192, 3), (128, 96, 3), (64, 48, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -107,6 +107,8 @@ class AD_Log(dict):
         self['train_aupr'] = 0
         self['train_accuracy'] = 0
         self['train_time'] = 0
+        self['n_train'] = 0
+        self['n_epochs'] = 0
 
         self['val_auc'] = 0
         self['val_aupr'] = 0